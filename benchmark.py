@@ -0,0 +1,184 @@
+'''
+Created on 18.10.2026
+
+Measures how long the engine spends in each state and gui,
+in frames and wall time, over many matches.
+Run directly to benchmark against simulated games:
+python benchmark.py [matches] [engines] [report.json] [port]
+With a port, the games run in a separate process and the engines connect
+to them over dolphinWatch's protocol at port, port+1 and so on,
+see simulation.serve(). Otherwise they run in the engines' process.
+'''
+
+import sys
+import json
+import time
+import random
+import logging
+import multiprocessing
+from collections import defaultdict
+
+import gevent
+
+from pbrEngine import PBREngine
+from pbrEngine.states import PbrStates, PbrGuis
+from pbrEngine.simulation import SimulatedDolphin, serve
+
+
+def percentiles(values, ps=(50, 90, 99)):
+    '''Nearest-rank percentiles of <values>, plus count, min, max and mean.'''
+    values = sorted(values)
+    if not values:
+        return {"count": 0}
+    result = {"count": len(values), "min": values[0], "max": values[-1],
+              "mean": sum(values) / len(values)}
+    for p in ps:
+        rank = max(0, -(-p * len(values) // 100) - 1)
+        result["p%d" % p] = values[rank]
+    return result
+
+
+class Benchmark(object):
+    '''
+    Listens to an engine's state and gui changes and remembers how long each
+    state and gui lasted, in frames and seconds. Also counts the inputs the
+    stuck checker had to repeat per state, and the time from starting to
+    prepare a match to the first move selection, not counting the time spent
+    waiting for start() to be called.
+    Can be attached to many engines at once, the results get aggregated.
+    '''
+    def __init__(self):
+        self.states = defaultdict(list)  # name -> [(frames, seconds)]
+        self.guis = defaultdict(list)
+        self.stuck = defaultdict(int)
+        self.first_move = []  # [(frames, seconds)]
+        self.matches = 0
+
+    def attach(self, pbr):
+        tracker = _Tracker(self, pbr)
+        pbr.on_state += tracker.onState
+        pbr.on_gui += tracker.onGui
+        pbr.on_stuck += tracker.onStuck
+
+    def report(self):
+        '''Returns the aggregated results as a json serializable dict.'''
+        def table(durations):
+            return {name: {"frames": percentiles([f for f, _ in values]),
+                           "seconds": percentiles([s for _, s in values])}
+                    for name, values in sorted(durations.items())}
+        return {
+            "matches": self.matches,
+            "states": table(self.states),
+            "guis": table(self.guis),
+            "stuck": dict(sorted(self.stuck.items())),
+            "time_to_first_move": table({"all": self.first_move})["all"],
+        }
+
+    def save(self, filename):
+        with open(filename, "w") as f:
+            json.dump(self.report(), f, indent=2)
+
+
+class _Tracker(object):
+    # keeps the per-engine bookkeeping for a Benchmark
+    def __init__(self, benchmark, pbr):
+        self._benchmark = benchmark
+        self._pbr = pbr
+        self._state = None
+        self._gui = None
+        self._setupStart = None
+        self._waited = (0, 0.0)
+
+    def _now(self):
+        return self._pbr.timer.frame, time.perf_counter()
+
+    def _since(self, start):
+        frame, seconds = self._now()
+        return frame - start[0], seconds - start[1]
+
+    def onState(self, state):
+        # the engine sometimes sets states as plain ints
+        state = PbrStates(state)
+        if self._state:
+            name, start = self._state
+            duration = self._since(start)
+            self._benchmark.states[name].append(duration)
+            if name == PbrStates.WAITING_FOR_START.name:
+                self._waited = (self._waited[0] + duration[0],
+                                self._waited[1] + duration[1])
+        self._state = (state.name, self._now())
+        if state == PbrStates.MATCH_ENDED:
+            self._benchmark.matches += 1
+        elif PbrStates.CREATING_SAVE1 <= state <= PbrStates.PREPARING_START \
+                and self._setupStart is None:
+            # savestates can skip straight to any of these
+            self._setupStart = self._now()
+            self._waited = (0, 0.0)
+
+    def onGui(self, gui):
+        gui = PbrGuis(gui)
+        if self._gui:
+            name, start = self._gui
+            self._benchmark.guis[name].append(self._since(start))
+        self._gui = (gui.name, self._now())
+        if gui == PbrGuis.MATCH_MOVE_SELECT and self._setupStart:
+            frames, seconds = self._since(self._setupStart)
+            self._benchmark.first_move.append((frames - self._waited[0],
+                                               seconds - self._waited[1]))
+            self._setupStart = None
+
+    def onStuck(self, button):
+        self._benchmark.stuck[PbrStates(self._pbr.state).name] += 1
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING, stream=sys.stdout)
+    matches = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    engines = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    filename = sys.argv[3] if len(sys.argv) > 3 else "benchmark.json"
+    port = int(sys.argv[4]) if len(sys.argv) > 4 else None
+    with open("testpkmn.json", encoding="utf-8") as f:
+        data = json.load(f)
+
+    benchmark = Benchmark()
+
+    def actionCallback(side, fails, moves, switch, cause):
+        if moves:
+            return (random.choice("abcd"), None)
+        return (random.choice("123"), None)
+
+    server = None
+    if port:
+        # spawned, not forked, so the games get a hub of their own
+        server = multiprocessing.get_context("spawn").Process(
+            target=serve, args=(engines, port), kwargs={"fps": 6000},
+            daemon=True)
+        server.start()
+
+    def run(i):
+        if port:
+            pbr = PBREngine(actionCallback, port=port + i)
+        else:
+            pbr = PBREngine(actionCallback, dolphin=SimulatedDolphin(fps=6000))
+
+        def onState(state):
+            if state == PbrStates.WAITING_FOR_NEW:
+                pkmn = random.sample(data, 6)
+                gevent.spawn(pbr.new, 0, pkmn[:3], pkmn[3:])
+            elif state == PbrStates.WAITING_FOR_START:
+                gevent.spawn(pbr.start)
+        pbr.on_state += onState
+        benchmark.attach(pbr)
+        pbr.connect()
+
+    for i in range(engines):
+        run(i)
+    while benchmark.matches < matches:
+        gevent.sleep(1)
+    if server:
+        server.terminate()
+    benchmark.save(filename)
+    print("%d matches, report written to %s" % (benchmark.matches, filename))
+
+if __name__ == "__main__":
+    main()
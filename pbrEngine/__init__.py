@@ -2,3 +2,5 @@
 from .engine import PBREngine, ActionCause
 from .memorymap.values import Colosseums
 from .avatars import AvatarsBlue, AvatarsRed
+from .battlelog import BattleEvent, BattleEvents
+from .util import DispatchMode
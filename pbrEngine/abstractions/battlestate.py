@@ -0,0 +1,144 @@
+'''
+Created on 18.10.2026
+
+What is known about both teams during a match, refreshed from memory
+with one read of each side's battle struct.
+'''
+
+import struct
+
+from ..memorymap.addresses import Locations
+from ..memorymap.values import BattleStructOffsets
+
+
+def statusName(val):
+    '''
+    Turns a status byte from memory into the names used by on_stat_update:
+    brn, frz, par, psn, slp or tox (badly poisoned), or None.
+    '''
+    return {
+        0x00: None,
+        0x08: "psn",
+        0x10: "brn",
+        0x20: "frz",
+        0x40: "par",
+        0x80: "tox"
+    }.get(val, "slp")  # slp can be 0x01-0x07
+
+
+class PokemonState(object):
+    '''
+    <hp>, <status> and <pp> of a pokemon, None until it was active once.
+    <sleep> is the number of sleep rounds left, if asleep.
+    <pp> is a list with the pp of each of the 4 move slots.
+    '''
+    __slots__ = ("hp", "status", "sleep", "pp")
+
+    def __init__(self):
+        self.hp = None
+        self.status = None
+        self.sleep = None
+        self.pp = None
+
+    def asDict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class BattleState(object):
+    '''
+    Keeps a PokemonState for every pokemon of both teams, indexed like
+    the match's monindex.
+    Each side's active pokemon is in memory as a battle struct,
+    see Locations.BATTLE_BLUE and BattleStructOffsets. The others keep what
+    was read while they were active last. <active> has the index of the
+    pokemon each side's struct got last credited to, None before the first.
+    The engine calls update() with one read of each side's struct,
+    see regions().
+
+    The struct has no known field telling which pokemon it holds, so reads
+    only get credited while they agree with the match's active pokemon,
+    see _agrees(). Reads around a switch get skipped instead of giving one
+    pokemon's hp or pp to another.
+    '''
+    def __init__(self, match):
+        self._match = match
+        self.teams = {"blue": [], "red": []}
+        self.active = {"blue": None, "red": None}
+        self.frame = None  # frame of the last update
+
+    def reset(self):
+        '''Starts over for the teams of the current match.'''
+        self.teams = {"blue": [PokemonState() for _ in self._match.pkmn_blue],
+                      "red": [PokemonState() for _ in self._match.pkmn_red]}
+        self.active = {"blue": None, "red": None}
+        self.frame = None
+
+    @staticmethod
+    def regions():
+        '''Returns (side, addr, length) of the battle struct of each side.'''
+        return [(side, loc.value.addr, loc.value.length) for side, loc in
+                (("blue", Locations.BATTLE_BLUE), ("red", Locations.BATTLE_RED))]
+
+    def _agrees(self, side, index, pp):
+        '''
+        Returns whether a struct with <pp> holds <side>'s pokemon <index>,
+        the one active according to the match.
+        A pokemon's pp only go down while it's in. After the match switched,
+        the struct holds the new pokemon once its pp differ from the old one's,
+        and equal the new one's if it was in before. Until it used a move,
+        a new pokemon with the same pp as the old one can't be told apart.
+        '''
+        active = self.active[side]
+        if active is None:
+            return True  # first read of the match
+        old = self.teams[side][active].pp
+        if index == active:
+            # more pp means it got replaced without the match noticing yet,
+            # e.g. by Roar. A Leppa Berry looks like that too.
+            return all(new <= last for new, last in zip(pp, old))
+        if pp == old:
+            return False  # not switched in memory yet
+        new = self.teams[side][index].pp
+        return new is None or pp == new
+
+    def update(self, side, data, frame=None):
+        '''
+        Applies <side>'s battle struct <data> to its active pokemon,
+        if they agree. Returns a list of the fields that changed, each as a dict
+        {"side": side, "monindex": index, "field": name, "old": .., "new": ..}.
+        A switch is the field "active" with the old and new index.
+        '''
+        team = self.teams[side]
+        if not team:
+            return []
+        self.frame = frame
+        index = self._match.current_blue if side == "blue" \
+            else self._match.current_red
+        pp = list(data[BattleStructOffsets.PP:BattleStructOffsets.PP+4])
+        if not self._agrees(side, index, pp):
+            return []
+        changes = []
+        if index != self.active[side]:
+            changes.append({"side": side, "monindex": index, "field": "active",
+                            "old": self.active[side], "new": index})
+            self.active[side] = index
+        pokemon = team[index]
+        status = data[BattleStructOffsets.STATUS]
+        hp, = struct.unpack_from(">H", data, BattleStructOffsets.HP)
+        name = statusName(status)
+        for field, new in (("hp", hp), ("status", name),
+                           ("sleep", status if name == "slp" else None),
+                           ("pp", pp)):
+            old = getattr(pokemon, field)
+            if old != new:
+                setattr(pokemon, field, new)
+                changes.append({"side": side, "monindex": index,
+                                "field": field, "old": old, "new": new})
+        return changes
+
+    def snapshot(self):
+        '''Returns the whole state as plain dicts and lists.'''
+        return {"frame": self.frame,
+                "active": dict(self.active),
+                "teams": {side: [pokemon.asDict() for pokemon in team]
+                          for side, team in self.teams.items()}}
@@ -25,7 +25,7 @@ class Match(object):
         self.on_win = EventHook(winner=str)
         self.on_switch = EventHook(side=str, monindex=int)
 
-        self._check_greenlet = None
+        self._check_job = None
         self._lastMove = ("blue", "")
 
     def new(self, pkmn_blue, pkmn_red):
@@ -118,11 +118,11 @@ class Match(object):
         '''Initiates a delayed win detection.
         Has to be delayed, because there might be followup-deaths.'''
         if not any(self.alive_blue) or not any(self.alive_red):
-            # kill already running wincheckers
-            if self._check_greenlet and not self._check_greenlet.ready():
-                self._check_greenlet.kill()
+            # cancel already scheduled wincheckers
+            if self._check_job:
+                self._check_job.cancel()
             # 11s delay = enough time for swampert (>7s death animation) to die
-            self._check_greenlet = self._timer.spawn_later(660, self.checkWinner)
+            self._check_job = self._timer.spawn_later(660, self.checkWinner)
 
     def switched(self, side, next_pkmn):
         '''
@@ -0,0 +1,68 @@
+'''
+Created on 18.10.2026
+
+Write-through cache sitting between the engine and dolphinWatch.
+'''
+
+
+class ShadowMemory(object):
+    '''
+    Wraps a DolphinConnection and remembers the last value written to each
+    of the given locations. Writing the same value to such a location again
+    is dropped instead of being sent to Dolphin.
+    Only use this for locations the game itself never changes, because the
+    shadow copy can't notice the game overwriting a value.
+    Everything that isn't a write is passed through to the connection.
+    '''
+    def __init__(self, dolphin, locations=()):
+        self._dolphin = dolphin
+        self._cacheable = {loc.value.addr: loc.value.length for loc in locations}
+        self._shadow = {}
+        self.writes_issued = 0
+        self.writes_suppressed = 0
+
+    def __getattr__(self, name):
+        return getattr(self._dolphin, name)
+
+    def invalidate(self, addr=None, length=1):
+        '''
+        Forgets the remembered values of all locations overlapping the
+        given range, or all of them if <addr> is None.
+        Must be called whenever the memory got changed behind our back.
+        '''
+        if addr is None:
+            self._shadow.clear()
+            return
+        for cached in list(self._shadow.keys()):
+            if cached < addr + length and addr < cached + self._cacheable[cached]:
+                del self._shadow[cached]
+
+    def _write(self, write, length, addr, val):
+        if self._cacheable.get(addr) == length:
+            if self._shadow.get(addr) == val:
+                self.writes_suppressed += 1
+                return
+            self._shadow[addr] = val
+        else:
+            self.invalidate(addr, length)
+        self.writes_issued += 1
+        write(addr, val)
+
+    def write8(self, addr, val):
+        self._write(self._dolphin.write8, 1, addr, val)
+
+    def write16(self, addr, val):
+        self._write(self._dolphin.write16, 2, addr, val)
+
+    def write32(self, addr, val):
+        self._write(self._dolphin.write32, 4, addr, val)
+
+    def writeMulti(self, addr, data):
+        self.invalidate(addr, len(data))
+        self.writes_issued += 1
+        self._dolphin.writeMulti(addr, data)
+
+    def load(self, filename):
+        # the whole memory gets replaced, nothing remembered is valid anymore
+        self.invalidate()
+        return self._dolphin.load(filename)
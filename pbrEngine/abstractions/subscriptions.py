@@ -0,0 +1,210 @@
+'''
+Created on 18.10.2026
+
+Groups memory subscriptions lying close to each other into single
+region subscriptions, and hands the changed parts back to the
+original callbacks.
+'''
+
+from ..memorymap.addresses import Locations
+
+
+class _Watcher(object):
+    def __init__(self, addr, length, callback, multi, group):
+        self.addr = addr
+        self.length = length
+        self.callback = callback
+        self.multi = multi  # callback wants the bytes instead of a value
+        self.group = group
+        self.last = None
+
+    @property
+    def end(self):
+        return self.addr + self.length
+
+    def feed(self, data):
+        data = bytes(data)
+        if data == self.last:
+            return
+        self.last = data
+        if self.multi:
+            self.callback(data)
+        else:
+            self.callback(int.from_bytes(data, "big"))
+
+    def feedValue(self, val):
+        if val == self.last:
+            return
+        self.last = val
+        self.callback(val)
+
+
+class Region(object):
+    '''
+    A contiguous piece of memory subscribed to as a whole.
+    Each watcher gets called with its slice of the region,
+    but only if that slice changed.
+    '''
+    def __init__(self, watchers, group=None):
+        self.addr = min(w.addr for w in watchers)
+        self.length = max(w.end for w in watchers) - self.addr
+        self.watchers = watchers
+        self.group = group
+
+    def update(self, data):
+        data = bytes(data)
+        for w in self.watchers:
+            start = w.addr - self.addr
+            w.feed(data[start:start+w.length])
+
+
+class SubscriptionPlanner(object):
+    '''
+    Collects the subscriptions of interest and turns them into as few
+    dolphinWatch subscriptions as possible.
+    Watchers are merged into one region if the gap between them is at most
+    <gap> bytes, as long as the region doesn't grow beyond <max_length>.
+    A negative gap disables merging.
+    A bigger gap means less subscriptions, but more data being sent
+    each time something in between changes.
+
+    Watchers can be put into named groups, which can be subscribed and
+    unsubscribed independently. Watchers without a group are always active.
+    Regions never span multiple groups.
+    Deactivating a group makes its watchers forget the last data they have
+    seen, because changes while unsubscribed go unnoticed. So after
+    reactivating a group, the first data is always reported, just like
+    with a new subscription.
+    '''
+    def __init__(self, dolphin, gap=0x40, max_length=0x400):
+        self._dolphin = dolphin
+        self.gap = gap
+        self.max_length = max_length
+        self._watchers = []
+        self.regions = []
+        self.active = set()
+
+    def add(self, loc, callback, multi=False, group=None):
+        '''
+        Registers a callback for the Loc <loc>.
+        If <multi> is True, the callback gets the raw bytes,
+        otherwise the big endian value.
+        '''
+        self._watchers.append(_Watcher(loc.addr, loc.length, callback, multi,
+                                       group))
+
+    def plan(self):
+        '''Computes the regions from all registered watchers.'''
+        regions = []
+        groups = []
+        for w in self._watchers:
+            if w.group not in groups:
+                groups.append(w.group)
+        for group in groups:
+            watchers = [w for w in self._watchers if w.group == group]
+            regions += self._planGroup(watchers, group)
+        return regions
+
+    def _planGroup(self, watchers, group):
+        regions = []
+        current = []
+        for w in sorted(watchers, key=lambda w: w.addr):
+            if current:
+                start = current[0].addr
+                end = max(c.end for c in current)
+                if w.addr - end <= self.gap and \
+                        max(end, w.end) - start <= self.max_length:
+                    current.append(w)
+                    continue
+                regions.append(Region(current, group))
+            current = [w]
+        if current:
+            regions.append(Region(current, group))
+        return regions
+
+    def apply(self, groups=()):
+        '''
+        Plans the regions and subscribes to the ungrouped ones
+        and the ones of the given groups.
+        '''
+        self.regions = self.plan()
+        self.active = set(groups)
+        for region in self.regions:
+            if region.group is None or region.group in self.active:
+                self._subscribeRegion(region)
+
+    def setActive(self, groups):
+        '''
+        Activates exactly the given groups. Unsubscribes the regions of
+        groups not in <groups> and subscribes to the newly activated ones.
+        '''
+        groups = set(groups)
+        for group in self.active - groups:
+            self.deactivate(group)
+        for group in groups - self.active:
+            self.activate(group)
+
+    def activate(self, group):
+        if group in self.active:
+            return
+        self.active.add(group)
+        for region in self.regions:
+            if region.group == group:
+                self._subscribeRegion(region)
+
+    def deactivate(self, group):
+        if group not in self.active:
+            return
+        self.active.remove(group)
+        for region in self.regions:
+            if region.group == group:
+                self._unsubscribeRegion(region)
+                for w in region.watchers:
+                    w.last = None
+
+    def _subscribeRegion(self, region):
+        if len(region.watchers) == 1:
+            # nothing to demultiplex, but still let the watcher filter
+            # data that didn't change
+            w = region.watchers[0]
+            if w.multi:
+                self._dolphin._subscribeMulti(w.length, w.addr, w.feed)
+            else:
+                self._dolphin._subscribe(w.length*8, w.addr, w.feedValue)
+        else:
+            self._dolphin._subscribeMulti(region.length, region.addr,
+                                          region.update)
+
+    def _unsubscribeRegion(self, region):
+        if len(region.watchers) == 1 and not region.watchers[0].multi:
+            self._dolphin.unSubscribe(region.addr)
+        else:
+            self._dolphin.unSubscribeMulti(region.addr)
+
+    def report(self):
+        '''
+        Returns a human readable description of the current plan,
+        one line per region.
+        '''
+        lines = []
+        for region in self.regions:
+            names = ", ".join(_locName(w.addr) for w in region.watchers)
+            lines.append("0x%08x-0x%08x (%4d bytes, %2d watchers) [%s]: %s"
+                         % (region.addr, region.addr + region.length,
+                            region.length, len(region.watchers),
+                            region.group or "always", names))
+        lines.append("%d watchers in %d subscriptions"
+                     % (len(self._watchers), len(self.regions)))
+        return "\n".join(lines)
+
+
+def _locName(addr):
+    for loc in Locations:
+        offset = addr - loc.value.addr
+        if offset == 0:
+            return loc.name
+        if 0 < offset and offset % loc.value.length == 0 and \
+                loc == Locations.EFFECTIVE_TEXT:
+            # this one is a list of strings
+            return "%s+0x%x" % (loc.name, offset)
+    return "0x%x" % addr
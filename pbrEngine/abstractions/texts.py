@@ -0,0 +1,96 @@
+'''
+Created on 18.10.2026
+
+Keeps track of the texts in the game's memory,
+so repeated messages can be noticed with as few writes as possible.
+'''
+
+from ..util import isInvalidated
+
+# "##", what texts get overwritten with to invalidate them
+_INVALIDATION = 0x00230023
+
+
+class TextTracker(object):
+    '''
+    Tracks a list of <slots> strings of <loc>'s length each, starting at <loc>.
+    Dolphin only reports changes, so a message identical to the one that
+    was in its slot before would go unnoticed. Slots get invalidated ("##")
+    to get around that, but only when needed:
+    If the game fills the slots like a ring buffer, the slot after the
+    newest message is the one the next message goes to. It was shown
+    a long time ago, so it gets invalidated right away.
+    As long as that hasn't been observed, or as soon as a message breaks
+    that order, the slot of each message gets invalidated <delay> frames
+    later instead, once it's off screen. Each slot has its own timer.
+    The default delay is a guess, longer than
+    "A critical hit! It's super effective!" stays up.
+    Slots known to be invalidated already are never written again.
+    '''
+    def __init__(self, dolphin, timer, loc, slots=1, delay=240):
+        self._dolphin = dolphin
+        self._timer = timer
+        self._loc = loc
+        self._slots = slots
+        self._delay = delay
+        self._invalid = [False] * slots
+        self._last = None  # slot of the newest message
+        self._ring = False  # observed the game advancing through the slots
+        self._pending = [None] * slots  # timed invalidation of each slot
+
+    def seen(self, data, slot=0):
+        '''
+        Must be called with every change of a slot.
+        Returns True if it's a new message, False for invalidations
+        and empty slots. Any message changes those, so they count as
+        invalidated.
+        '''
+        if isInvalidated(data) or bytes(data[:2]) == b"\0\0":
+            self._invalid[slot] = True
+            return False
+        self._invalid[slot] = False
+        # would invalidate the new message while it's on screen
+        self._cancel(slot)
+        if self._slots > 1:
+            if self._last is not None:
+                ring = slot == (self._last + 1) % self._slots
+                if self._ring and not ring:
+                    # messages the ring would have invalidated on its way
+                    for other in range(self._slots):
+                        if other != slot and not self._invalid[other] and \
+                                not self._pending[other]:
+                            self.invalidateLater(other)
+                self._ring = ring
+            self._last = slot
+            if self._ring:
+                self.invalidate((slot + 1) % self._slots)
+            else:
+                self.invalidateLater(slot)
+        return True
+
+    def invalidate(self, slot=0):
+        '''Invalidates <slot> now, if it isn't already.'''
+        if self._invalid[slot]:
+            return
+        self._invalid[slot] = True
+        self._dolphin.write32(self._loc.addr + self._loc.length * slot,
+                              _INVALIDATION)
+
+    def invalidateLater(self, slot=0):
+        '''Invalidates <slot> after <delay> frames, see the class doc.'''
+        self._cancel(slot)
+        self._pending[slot] = self._timer.spawn_later(self._delay,
+                                                      self.invalidate, slot)
+
+    def _cancel(self, slot):
+        if self._pending[slot]:
+            self._pending[slot].cancel()
+            self._pending[slot] = None
+
+    def reset(self):
+        '''Forget everything, e.g. after a savestate got loaded.'''
+        for slot in range(self._slots):
+            self._cancel(slot)
+        self._invalid = [False] * self._slots
+        self._last = None
+        self._ring = False
@@ -4,25 +4,129 @@ Created on 22.09.2015
 @author: Felk
 '''
 import gevent
+import heapq
+import itertools
 import time
 import collections
+from gevent.event import Event
+
+from ..util import EventHook
+
+
+class ScheduledJob(object):
+    '''
+    Handle for a job scheduled with Timer.spawn_later().
+    The job runs in its own greenlet once its frame is reached.
+    '''
+    def __init__(self, frame, job, args, kwargs):
+        self.frame = frame
+        self.cancelled = False
+        self.greenlet = None
+        self._job = job
+        self._args = args
+        self._kwargs = kwargs
+
+    def cancel(self):
+        '''
+        Cancels the job if it didn't run yet.
+        If it is running already, its greenlet gets killed.
+        '''
+        self.cancelled = True
+        if self.greenlet:
+            self.greenlet.kill(block=False)
+
+    def ready(self):
+        '''Returns True if the job got cancelled or has finished.'''
+        if self.cancelled:
+            return True
+        return self.greenlet is not None and self.greenlet.ready()
+
+    def _run(self):
+        if not self.cancelled:
+            self.greenlet = gevent.spawn(self._job, *self._args, **self._kwargs)
 
 
 class Timer(object):
-    def __init__(self):
+    '''
+    Keeps track of the game's framecount and schedules frame-timed actions.
+
+    Normally updateFramecount gets called for every single frame.
+    If coarse updates are allowed (see setCoarse), the framecount may instead
+    only be sampled every <resolution> seconds. Waits ending in between
+    samples are then estimated from wall time and the measured emulation
+    speed. As soon as a wait of at most <precise_frames> frames is pending,
+    exact per-frame updates are requested again.
+    Mode changes are announced through on_clock_mode.
+    '''
+    def __init__(self, resolution=0.1, precise_frames=10):
         self.frame = 0
         self._framePrev = 0
-        self._timerPrev = time.clock()
+        self._timerPrev = time.perf_counter()
         self.speed_plots = collections.deque([1.0], 20)
+        # priority queue of (frame, sequence number, callable, precise).
+        # gets worked off by updateFramecount
+        self._queue = []
+        self._sequence = itertools.count()
+        self._precisePending = 0
+        self.resolution = resolution
+        self.precise_frames = precise_frames
+        self._coarse = False
+        self.exact = True
+        self._interpolation = None
+        '''
+        Event of the needed framecount resolution changing.
+        arg0: <exact> True if every single frame must be reported,
+              False if sampling every <resolution> seconds is enough.
+        '''
+        self.on_clock_mode = EventHook(exact=bool)
+
+    def setCoarse(self, allowed):
+        '''
+        Sets whether the framecount may be sampled coarsely.
+        Exact updates are still requested while precise waits are pending.
+        '''
+        self._coarse = allowed
+        self._updateMode()
+
+    def _updateMode(self):
+        exact = not self._coarse or self._precisePending > 0
+        if exact != self.exact:
+            self.exact = exact
+            if exact and self._interpolation:
+                self._interpolation.kill(block=False)
+                self._interpolation = None
+            self.on_clock_mode(exact=exact)
+
+    def _estimatedFrame(self):
+        if self.exact:
+            return self.frame
+        # don't extrapolate further than until the next sample is due
+        elapsed = min(time.perf_counter() - self._timerPrev, self.resolution)
+        return self.frame + int(elapsed * 60 * self.speed_plots[-1])
+
+    def _schedule(self, frames, callback, frame=None):
+        # <frame> is when to run it, if already calculated from <frames>
+        if frame is None:
+            frame = self._estimatedFrame() + frames
+        precise = frames <= self.precise_frames
+        heapq.heappush(self._queue, (frame, next(self._sequence), callback,
+                                     precise))
+        if precise:
+            self._precisePending += 1
+            self._updateMode()
+        elif not self.exact:
+            self._interpolate()
 
     def sleep(self, frames):
         '''
         Shall be called as a sleep() function based on emulated time.
         Uses the game's framecount as timesource.
         '''
-        finish = self.frame + frames
-        while self.frame < finish:
-            gevent.sleep(0.05)
+        if frames <= 0:
+            return
+        wakeup = Event()
+        self._schedule(frames, wakeup.set)
+        wakeup.wait()
 
     def sleepThen(self, frames, then, *args):
         '''
@@ -34,11 +138,42 @@ class Timer(object):
 
     def spawn_later(self, frames, job, *args, **kwargs):
         '''
-        Spawns a new greenlet that performs an action in a given time,
+        Schedules an action to be performed in a given time,
         based on ingame frames as a timesource.
-        Returns the greenlet that gets spawned.
+        Returns a ScheduledJob, which can be cancelled.
+        '''
+        frame = self._estimatedFrame() + frames
+        scheduled = ScheduledJob(frame, job, args, kwargs)
+        self._schedule(frames, scheduled._run, frame)
+        return scheduled
+
+    def _dispatch(self, frame):
+        while self._queue and self._queue[0][0] <= frame:
+            _, _, callback, precise = heapq.heappop(self._queue)
+            if precise:
+                self._precisePending -= 1
+            callback()
+        self._updateMode()
+
+    def _interpolate(self):
+        '''
+        Only used with coarse updates. Dispatches what is due by estimation
+        and plans the next estimated dispatch, if it happens before the next
+        sample is expected.
         '''
-        return gevent.spawn(self.sleepThen, frames, job, *args, **kwargs)
+        self._interpolation = None
+        self._dispatch(self._estimatedFrame())
+        if self.exact or not self._queue:
+            return
+        frames = self._queue[0][0] - self._estimatedFrame()
+        fps = 60 * self.speed_plots[-1]
+        if fps <= 0:
+            return
+        delay = max(frames / fps, 0)
+        if delay < self.resolution:
+            if self._interpolation:
+                self._interpolation.kill(block=False)
+            self._interpolation = gevent.spawn_later(delay, self._interpolate)
 
     def updateFramecount(self, framecount):
         # Is called for every new framecount reported.
@@ -46,7 +181,7 @@ class Timer(object):
         # measurements
         delta = framecount - self._framePrev
 
-        now = time.clock()
+        now = time.perf_counter()
         deltaReal = now - self._timerPrev
 
         self._framePrev = framecount
@@ -59,3 +194,9 @@ class Timer(object):
         delta /= 60.0  # frame count, increases by 60/s
         speed = (delta / deltaReal) if deltaReal > 0 else 0  # wat
         self.speed_plots.append(speed)
+
+        # wake up everything that became due with this frame
+        if self.exact:
+            self._dispatch(self.frame)
+        else:
+            self._interpolate()
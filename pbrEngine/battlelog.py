@@ -0,0 +1,203 @@
+'''
+Created on 18.10.2026
+
+Classifies PBR's battle messages into typed events,
+with a single regular expression covering all known messages.
+'''
+
+import re
+from enum import IntEnum, unique
+
+
+@unique
+class BattleEvents(IntEnum):
+    OTHER          = 0   # not in the catalog, see BattleEvent.text
+    MOVE           = 1   # value: move name
+    FAINTED        = 2
+    DRAGGED_OUT    = 3
+    CRITICAL       = 4   # value: effectiveness if in the same message
+    EFFECTIVENESS  = 5   # value: "super", "not very" or "immune"
+    MISSED         = 6
+    STAT_CHANGE    = 7   # value: stat, amount: stages, 0 if at the limit
+    STATUS         = 8   # value: status, see below
+    STATUS_ACTIVE  = 9   # value: status that kept the pokemon from moving
+    STATUS_END     = 10  # value: status
+    DAMAGE         = 11  # value: cause
+    HEAL           = 12
+    WEATHER        = 13  # value: weather, amount: 1 started, 0 lasts, -1 ended
+    ITEM           = 14  # value: item name
+    ABILITY        = 15  # value: ability name, target: affected pokemon
+
+
+class BattleEvent(object):
+    '''
+    One classified battle message.
+    <side> and <pkmn> are the team ("blue" or "red") and ingame name
+    of the pokemon the message is about, or None.
+    Statuses are named like in on_stat_update (brn, frz, par, psn, slp, tox),
+    plus cnf for confusion.
+    '''
+    __slots__ = ("kind", "side", "pkmn", "value", "amount", "target", "text")
+
+    def __init__(self, kind, text, side=None, pkmn=None, value=None,
+                 amount=None, target=None):
+        self.kind = kind
+        self.text = text
+        self.side = side
+        self.pkmn = pkmn
+        self.value = value
+        self.amount = amount
+        self.target = target
+
+    def __repr__(self):
+        fields = ", ".join("%s=%r" % (name, getattr(self, name))
+                           for name in self.__slots__[1:]
+                           if getattr(self, name) is not None)
+        return "BattleEvent(%s, %s)" % (self.kind.name, fields)
+
+
+_STATS = ("Attack", "Defense", "Speed", "Sp. Atk", "Sp. Def", "accuracy",
+          "evasiveness")
+
+# placeholders of the catalog below and what they match
+_PLACEHOLDERS = {
+    "pkmn": r"Team (?P<side>Blue|Red)'s (?P<pkmn>.+?)",
+    "target": r"Team (?:Blue|Red)'s (?P<target>.+?)",
+    "value": r"(?P<value>.+?)",
+    # move names start uppercase and never contain " used ", "!" or "'".
+    # Makes "used" in a pokemon's name belong to the name, and keeps other
+    # messages about such a pokemon from being taken for moves.
+    "move": r"(?P<value>[A-Z](?:(?! used )[^!'])*)",
+    "stat": r"(?P<value>%s)" % "|".join(re.escape(stat) for stat in _STATS),
+}
+
+# (kind, message, value, amount). Gets tried in order, so more specific
+# messages must come before more generic ones.
+CATALOG = [
+    (BattleEvents.MOVE, "{pkmn} used {move}!", None, None),
+    (BattleEvents.FAINTED, "{pkmn} fainted!", None, None),
+    (BattleEvents.DRAGGED_OUT, "{pkmn} was dragged out!", None, None),
+    (BattleEvents.CRITICAL, "A critical hit!", None, None),
+    (BattleEvents.CRITICAL, "A critical hit! It's super effective!", "super", None),
+    (BattleEvents.CRITICAL, "A critical hit! It's not very effective...", "not very", None),
+    (BattleEvents.EFFECTIVENESS, "It's super effective!", "super", None),
+    (BattleEvents.EFFECTIVENESS, "It's not very effective...", "not very", None),
+    (BattleEvents.EFFECTIVENESS, "It doesn't affect {pkmn}...", "immune", None),
+    (BattleEvents.MISSED, "{pkmn}'s attack missed!", None, None),
+    (BattleEvents.MISSED, "{pkmn} avoided the attack!", None, None),
+
+    (BattleEvents.STAT_CHANGE, "{pkmn}'s {stat} rose!", None, 1),
+    (BattleEvents.STAT_CHANGE, "{pkmn}'s {stat} sharply rose!", None, 2),
+    (BattleEvents.STAT_CHANGE, "{pkmn}'s {stat} rose drastically!", None, 3),
+    (BattleEvents.STAT_CHANGE, "{pkmn}'s {stat} fell!", None, -1),
+    (BattleEvents.STAT_CHANGE, "{pkmn}'s {stat} harshly fell!", None, -2),
+    (BattleEvents.STAT_CHANGE, "{pkmn}'s {stat} severely fell!", None, -3),
+    (BattleEvents.STAT_CHANGE, "{pkmn}'s {stat} won't go higher!", None, 0),
+    (BattleEvents.STAT_CHANGE, "{pkmn}'s {stat} won't go lower!", None, 0),
+
+    (BattleEvents.STATUS, "{pkmn} was poisoned!", "psn", None),
+    (BattleEvents.STATUS, "{pkmn} was badly poisoned!", "tox", None),
+    (BattleEvents.STATUS, "{pkmn} was burned!", "brn", None),
+    (BattleEvents.STATUS, "{pkmn} is paralyzed! It may be unable to move!", "par", None),
+    (BattleEvents.STATUS, "{pkmn} fell asleep!", "slp", None),
+    (BattleEvents.STATUS, "{pkmn} was frozen solid!", "frz", None),
+    (BattleEvents.STATUS, "{pkmn} became confused!", "cnf", None),
+    (BattleEvents.STATUS_ACTIVE, "{pkmn} is fast asleep.", "slp", None),
+    (BattleEvents.STATUS_ACTIVE, "{pkmn} is paralyzed! It can't move!", "par", None),
+    (BattleEvents.STATUS_ACTIVE, "{pkmn} is frozen solid!", "frz", None),
+    (BattleEvents.STATUS_ACTIVE, "{pkmn} is confused!", "cnf", None),
+    (BattleEvents.STATUS_END, "{pkmn} woke up!", "slp", None),
+    (BattleEvents.STATUS_END, "{pkmn} thawed out!", "frz", None),
+    (BattleEvents.STATUS_END, "{pkmn} was cured of paralysis.", "par", None),
+    (BattleEvents.STATUS_END, "{pkmn} snapped out of confusion!", "cnf", None),
+
+    (BattleEvents.DAMAGE, "{pkmn} is hurt by poison!", "psn", None),
+    (BattleEvents.DAMAGE, "{pkmn} is hurt by its burn!", "brn", None),
+    (BattleEvents.DAMAGE, "It hurt itself in its confusion!", "cnf", None),
+    (BattleEvents.DAMAGE, "{pkmn} is buffeted by the sandstorm!", "sandstorm", None),
+    (BattleEvents.DAMAGE, "{pkmn} is pelted by hail!", "hail", None),
+    (BattleEvents.DAMAGE, "{pkmn} is damaged by recoil!", "recoil", None),
+    (BattleEvents.DAMAGE, "{pkmn} is hurt by spikes!", "spikes", None),
+    (BattleEvents.DAMAGE, "Pointed stones dug into {pkmn}!", "stealth rock", None),
+    (BattleEvents.DAMAGE, "{pkmn} had its energy drained!", "drain", None),
+    (BattleEvents.HEAL, "{pkmn}'s HP was restored.", None, None),
+    (BattleEvents.HEAL, "{pkmn} regained health!", None, None),
+
+    (BattleEvents.WEATHER, "It started to rain!", "rain", 1),
+    (BattleEvents.WEATHER, "Rain continues to fall.", "rain", 0),
+    (BattleEvents.WEATHER, "The rain stopped.", "rain", -1),
+    (BattleEvents.WEATHER, "A sandstorm brewed!", "sandstorm", 1),
+    (BattleEvents.WEATHER, "The sandstorm rages.", "sandstorm", 0),
+    (BattleEvents.WEATHER, "The sandstorm subsided.", "sandstorm", -1),
+    (BattleEvents.WEATHER, "It started to hail!", "hail", 1),
+    (BattleEvents.WEATHER, "Hail continues to fall.", "hail", 0),
+    (BattleEvents.WEATHER, "The hail stopped.", "hail", -1),
+    (BattleEvents.WEATHER, "The sunlight turned harsh!", "sun", 1),
+    (BattleEvents.WEATHER, "The sunlight is strong.", "sun", 0),
+    (BattleEvents.WEATHER, "The sunlight faded.", "sun", -1),
+    (BattleEvents.WEATHER, "The fog is deep...", "fog", 0),
+
+    (BattleEvents.ABILITY, "{pkmn}'s Intimidate cuts {target}'s attack!", "Intimidate", -1),
+    (BattleEvents.ABILITY, "{pkmn}'s Speed Boost raised its Speed!", "Speed Boost", 1),
+    (BattleEvents.ABILITY, "{pkmn}'s Drizzle made it rain!", "Drizzle", None),
+    (BattleEvents.ABILITY, "{pkmn}'s Sand Stream whipped up a sandstorm!", "Sand Stream", None),
+    (BattleEvents.ABILITY, "{pkmn}'s Drought intensified the sun's rays!", "Drought", None),
+    (BattleEvents.ABILITY, "{pkmn}'s Snow Warning made it hail!", "Snow Warning", None),
+    (BattleEvents.ABILITY, "{pkmn} is exerting its Pressure!", "Pressure", None),
+    (BattleEvents.ABILITY, "{pkmn} breaks the mold!", "Mold Breaker", None),
+
+    (BattleEvents.ITEM, "{pkmn} restored a little HP using its {value}!", None, None),
+    (BattleEvents.ITEM, "{pkmn} hung on using its {value}!", None, None),
+    (BattleEvents.ITEM, "{pkmn} became fully charged due to its {value}!", None, None),
+    (BattleEvents.ITEM, "{pkmn} is hurt by its {value}!", None, None),
+    (BattleEvents.ITEM, "{pkmn} lost some of its HP!", "Life Orb", None),
+]
+
+
+class BattleLog(object):
+    '''
+    Compiles a catalog like CATALOG into one regular expression,
+    so each message gets classified with a single match.
+
+    >>> BattleLog().classify("Team Red's ONIX's Defense sharply rose!")
+    BattleEvent(STAT_CHANGE, side='red', pkmn='ONIX', value='Defense', amount=2, text="Team Red's ONIX's Defense sharply rose!")
+    '''
+    def __init__(self, catalog=CATALOG):
+        self._entries = []
+        alternatives = []
+        for i, (kind, message, value, amount) in enumerate(catalog):
+            prefix = "m%d_" % i
+            parts = re.split(r"\{(\w+)\}", message)
+            # literal text and placeholders alternate
+            pattern = "".join(
+                re.escape(part) if j % 2 == 0 else
+                _PLACEHOLDERS[part].replace("(?P<", "(?P<" + prefix)
+                for j, part in enumerate(parts))
+            alternatives.append("(?P<m%d>%s)" % (i, pattern))
+            groups = re.findall(r"\(\?P<(\w+)>", "".join(
+                _PLACEHOLDERS[part] for part in parts[1::2]))
+            self._entries.append((kind, prefix, value, amount, groups))
+        self._regex = re.compile("|".join(alternatives))
+
+    def classify(self, text):
+        '''Returns a BattleEvent for <text>, of kind OTHER if it's unknown.'''
+        match = self._regex.fullmatch(text)
+        if not match:
+            return BattleEvent(BattleEvents.OTHER, text)
+        # the alternative's own group is the last one to close
+        kind, prefix, value, amount, groups = \
+            self._entries[int(match.lastgroup[1:])]
+        found = {name: match.group(prefix + name) for name in groups}
+        side = found.get("side")
+        return BattleEvent(kind, text, side=side.lower() if side else None,
+                           pkmn=found.get("pkmn"),
+                           value=found.get("value", value), amount=amount,
+                           target=found.get("target"))
+
+
+_default = BattleLog()
+
+
+def classify(text):
+    '''Classifies <text> with the default catalog, see BattleLog.'''
+    return _default.classify(text)
@@ -6,27 +6,51 @@ Created on 09.09.2015
 
 import gevent
 import random
-import re
 import logging
 import dolphinWatch
 import os
+import hashlib
+import json
 from functools import partial
 from enum import Enum
 
-from .eps import get_pokemon_from_data
+from .eps import get_pokemon_blob, BlobStore
 
 from gevent.event import AsyncResult
-from .memorymap.addresses import Locations
+from .memorymap.addresses import Locations, Loc
 from .memorymap.values import WiimoteButton, CursorOffsets, CursorPosMenu,\
     CursorPosBP, GuiStateMatch, GuiTarget, DefaultValues, BPStructOffsets
 from .guiStateDistinguisher import Distinguisher
 from .states import PbrGuis, PbrStates
-from .util import bytesToString, floatToIntRepr, EventHook
-from .abstractions import timer, cursor, match
+from .util import bytesToString, floatToIntRepr, EventHook, TextRecognizer
+from .savestates import SavestateLibrary
+from .battlelog import classify, BattleEvent, BattleEvents
+from .abstractions import timer, cursor, match, shadow, subscriptions, texts,\
+    battlestate
 from .avatars import AvatarsBlue, AvatarsRed
 
 logger = logging.getLogger("pbrEngine")
 
+# distance between 2 pokemon in the battle pass struct.
+# the blobs themselves are only 0x88 bytes long.
+_BP_PKMN_STRIDE = 0x8c
+# how attack declarations start
+_TEAM_PREFIXES = TextRecognizer({"Team Blue's ": "blue", "Team Red's ": "red"})
+
+# locations only the engine writes to. Rewriting their current value
+# gets suppressed by the shadow memory.
+# Not in here, because the game changes them as well: RNG_SEED all the time,
+# BLUR1/BLUR2 during selection and SPEED_1/SPEED_2 in the demo.
+_SHADOWED_LOCATIONS = (
+    Locations.GUI_POS_Y,
+    Locations.FOV,
+)
+
+# subscription groups, only subscribed to during the respective phase
+_GROUP_SETUP = "setup"  # menu navigation
+_GROUP_MATCH = "match"  # battle texts and stats
+_GROUP_CLOCK = "clock"  # framecount, only while exact timing is needed
+
 
 class ActionCause(Enum):
     REGULAR = "regular"  # regular move selection
@@ -42,7 +66,10 @@ class PBREngine():
     def __init__(self, action_callback, host="localhost", port=6000,
                  savefile_dir="pbr_savefiles",
                  savefile_with_announcer_name="saveWithAnnouncer.state",
-                 savefile_without_announcer_name="saveWithoutAnnouncer.state"):
+                 savefile_without_announcer_name="saveWithoutAnnouncer.state",
+                 subscription_gap=0x40, clock_resolution=0.1, dolphin=None,
+                 savestate_budget=4 << 30, team_snapshots=False,
+                 blob_store=None, battle_state_interval=None):
         '''
         :param action_callback:
             will be called when a player action needs to be determined.
@@ -62,22 +89,67 @@ class PBREngine():
         :param savefile_dir: directory location of savestates
         :param savefile_with_announcer_name: filename of savefile with the announcer turned on
         :param savefile_without_announcer_name: filename of savefile with the announcer turned off
+        :param subscription_gap: max. number of bytes between 2 watched locations
+            for them to get merged into a single subscription. -1 disables merging.
+        :param clock_resolution: seconds between framecount samples while
+            the game runs with increased emulation and animation speed,
+            instead of getting every single frame reported.
+            None disables this and always reports every frame.
+        :param dolphin: connection to use instead of connecting to <host>:<port>,
+            e.g. a recording.Recorder or recording.Replayer
+        :param savestate_budget: max. bytes the additional savestates made
+            further into the match preparation may take up in <savefile_dir>.
+            The least recently used ones get deleted first.
+        :param team_snapshots: also save once both teams are ready on the
+            order selection. A later match with the same teams, avatars,
+            colosseum and announcer setting loads that directly.
+        :param blob_store: filename of a blob file made with
+            eps.blobstore, or an opened eps.BlobStore. Pokemon found in it
+            don't get encoded on injection. Others still do.
+        :param battle_state_interval: frames between refreshes of
+            battle_state while a match is running, each reading the battle
+            struct of both sides with one read per side. Gets the pp, which
+            isn't subscribed to. None disables the refreshes.
         '''
         self._action_callback = action_callback
         self._distinguisher = Distinguisher(self._distinguishGui)
-        self._dolphin = dolphinWatch.DolphinConnection(host, port)
+        # keeps track of the writes issued and suppressed, see
+        # shadow.writes_issued and shadow.writes_suppressed
+        if dolphin is None:
+            dolphin = dolphinWatch.DolphinConnection(host, port)
+        self.shadow = shadow.ShadowMemory(dolphin, _SHADOWED_LOCATIONS)
+        self._dolphin = self.shadow
         self._dolphin.onDisconnect(self._reconnect)
         self._dolphin.onConnect(self._initDolphinWatch)
+        self._subscriptionGap = subscription_gap
+        self._subscriptions = None
 
         os.makedirs(os.path.abspath(savefile_dir), exist_ok=True)
         self._savefile1 = os.path.abspath(os.path.join(savefile_dir, savefile_with_announcer_name))
         self._savefile2 = os.path.abspath(os.path.join(savefile_dir, savefile_without_announcer_name))
-
-        self.timer = timer.Timer()
+        self.savestates = SavestateLibrary(savefile_dir, savestate_budget)
+        self.team_snapshots = team_snapshots
+        if isinstance(blob_store, str):
+            blob_store = BlobStore(blob_store)
+        self.blob_store = blob_store
+
+        self._clockResolution = clock_resolution
+        self._clockPoller = None
+        self.timer = timer.Timer(clock_resolution or 0.1)
+        self.timer.on_clock_mode += self._clockModeChanged
         self.cursor = cursor.Cursor(self._dolphin)
         self.match = match.Match(self.timer)
         self.match.on_win += self._matchOver
         self.match.on_switch += self._switched
+        self.battle_state_interval = battle_state_interval
+        # hp, status and pp of all pokemon, see battlestate.BattleState
+        self.battle_state = battlestate.BattleState(self.match)
+        # to notice repeated messages, see texts.TextTracker
+        self._infoText = texts.TextTracker(self._dolphin, self.timer,
+                                           Locations.INFO_TEXT.value)
+        self._effTexts = texts.TextTracker(self._dolphin, self.timer,
+                                           Locations.EFFECTIVE_TEXT.value,
+                                           slots=9)
         self.match_speed = 1.0  # animation speed during match
         # event callbacks
         '''
@@ -134,6 +206,14 @@ class PBREngine():
         '''
         self.on_infobox = EventHook(text=str)
         '''
+        Event of a battle message (attack declaration, infobox or fly-by text)
+        being classified, see battlelog.CATALOG for the known messages.
+        Unknown messages come with kind BattleEvents.OTHER.
+        arg0: <event> the battlelog.BattleEvent, e.g.
+              BattleEvent(STATUS, side='red', pkmn='ONIX', value='brn', ...)
+        '''
+        self.on_battle_event = EventHook(event=BattleEvent)
+        '''
         Event of some stats getting updated.
         arg0: <type> what stat type got updated (e.g. "hp")
         arg1: <data> dictionary containing information on the new stat
@@ -144,18 +224,47 @@ class PBREngine():
             if status is "slp", the field "rounds" (remaining slp) will be included too
         '''
         self.on_stat_update = EventHook(type=str, data=dict)
+        '''
+        Event of battle_state changing on a refresh,
+        see battle_state_interval. Only has the fields that changed.
+        arg0: <changes> list of dicts like
+              {"side": "blue", "monindex": 0, "field": "hp", "old": 120, "new": 87}
+              A switch seen in memory is the field "active",
+              with the old and new monindex.
+        '''
+        self.on_battle_state = EventHook(changes=list)
+        '''
+        Event of the stuck checker repeating the last input,
+        because nothing happened for a while.
+        Propably only useful for debugging and benchmarking.
+        arg0: <button> the button pressed again
+        '''
+        self.on_stuck = EventHook(button=int)
+        # all events spawn a greenlet per listener. Frequent ones like
+        # on_gui, on_infobox or on_stat_update can be switched to a single
+        # worker greenlet each, if their listeners never block:
+        # pbr.on_gui.setDispatchMode(pbrEngine.DispatchMode.POOL)
 
         self._increasedSpeed = 20.0
         self._lastInputFrame = 0
         self._lastInput = 0
+        self._matchStartJobs = []
         self.volume = 50
         self.speed = 1.0
+        self._animSpeed = 1.0
         self.state = PbrStates.INIT
         self.colosseum = 0
         self.avatar_blue = AvatarsBlue.BLUE
         self.avatar_red = AvatarsRed.RED
         self._prev_avatar_blue = AvatarsBlue.BLUE
         self._prev_avatar_red = AvatarsRed.RED
+        # battle pass number -> number of pokemon on it, if known
+        self._bpCounts = {}
+        # state -> [battle pass, number of pokemon to remove/add]
+        self._bpPlan = {}
+        self._snapshotKey = None
+        # encoded blobs of the current teams, see _encodeTeams()
+        self._teamBlobs = None
         self.announcer = True
         self.hide_gui = False
         self.gui = PbrGuis.MENU_MAIN  # most recent/last gui, for info
@@ -179,51 +288,86 @@ class PBREngine():
         self._dolphin.disconnect()
 
     def _initDolphinWatch(self, watcher):
+        # might be a restarted dolphin, don't trust anything remembered
+        self.shadow.invalidate()
         self._dolphin.volume(self.volume)
+        self._subscriptions = subscriptions.SubscriptionPlanner(
+            self._dolphin, self._subscriptionGap)
 
         # ## subscribing to all indicators of interest. mostly gui
         # misc. stuff processed here
         self._subscribe(Locations.WHICH_PLAYER.value,               self._distinguishPlayer)
-        self._subscribe(Locations.GUI_STATE_MATCH_PKMN_MENU.value,  self._distinguishPkmnMenu)
-        self._subscribe(Locations.ORDER_LOCK_BLUE.value,            self._distinguishOrderLock)
-        self._subscribe(Locations.ORDER_LOCK_RED.value,             self._distinguishOrderLock)
-        self._subscribeMulti(Locations.ATTACK_TEXT.value,           self._distinguishAttack)
-        self._subscribeMulti(Locations.INFO_TEXT.value,             self._distinguishInfo)
-        self._subscribe(Locations.HP_BLUE.value,                    partial(self._distinguishHp, side="blue"))
-        self._subscribe(Locations.HP_RED.value,                     partial(self._distinguishHp, side="red"))
-        self._subscribe(Locations.STATUS_BLUE.value,                partial(self._distinguishStatus, side="blue"))
-        self._subscribe(Locations.STATUS_RED.value,                 partial(self._distinguishStatus, side="red"))
-        self._subscribeMultiList(9, Locations.EFFECTIVE_TEXT.value, self._distinguishEffective)
+        self._subscribe(Locations.GUI_STATE_MATCH_PKMN_MENU.value,  self._distinguishPkmnMenu, _GROUP_MATCH)
+        self._subscribe(Locations.ORDER_LOCK_BLUE.value,            self._distinguishOrderLock, _GROUP_SETUP)
+        self._subscribe(Locations.ORDER_LOCK_RED.value,             self._distinguishOrderLock, _GROUP_SETUP)
+        self._subscribeMulti(Locations.ATTACK_TEXT.value,           self._distinguishAttack, _GROUP_MATCH)
+        self._subscribeMulti(Locations.INFO_TEXT.value,             self._distinguishInfo, _GROUP_MATCH)
+        self._subscribe(Locations.HP_BLUE.value,                    partial(self._distinguishHp, side="blue"), _GROUP_MATCH)
+        self._subscribe(Locations.HP_RED.value,                     partial(self._distinguishHp, side="red"), _GROUP_MATCH)
+        self._subscribe(Locations.STATUS_BLUE.value,                partial(self._distinguishStatus, side="blue"), _GROUP_MATCH)
+        self._subscribe(Locations.STATUS_RED.value,                 partial(self._distinguishStatus, side="red"), _GROUP_MATCH)
+        self._subscribeMultiList(9, Locations.EFFECTIVE_TEXT.value, self._distinguishEffective, _GROUP_MATCH)
         # de-multiplexing all these into single PbrGuis-enum using distinguisher
         self._subscribe(Locations.GUI_STATE_MATCH.value,        self._distinguisher.distinguishMatch)
-        self._subscribe(Locations.GUI_STATE_BP.value,           self._distinguisher.distinguishBp)
-        self._subscribe(Locations.GUI_STATE_MENU.value,         self._distinguisher.distinguishMenu)
-        self._subscribe(Locations.GUI_STATE_RULES.value,        self._distinguisher.distinguishRules)
-        self._subscribe(Locations.GUI_STATE_ORDER.value,        self._distinguisher.distinguishOrder)
-        self._subscribe(Locations.GUI_STATE_BP_SELECTION.value, self._distinguisher.distinguishBpSelect)
-        self._subscribeMulti(Locations.GUI_TEMPTEXT.value,      self._distinguisher.distinguishStart)
-        self._subscribe(Locations.POPUP_BOX.value,              self._distinguisher.distinguishPopup)
+        self._subscribe(Locations.GUI_STATE_BP.value,           self._distinguisher.distinguishBp, _GROUP_SETUP)
+        self._subscribe(Locations.GUI_STATE_MENU.value,         self._distinguisher.distinguishMenu, _GROUP_SETUP)
+        self._subscribe(Locations.GUI_STATE_RULES.value,        self._distinguisher.distinguishRules, _GROUP_SETUP)
+        self._subscribe(Locations.GUI_STATE_ORDER.value,        self._distinguisher.distinguishOrder, _GROUP_SETUP)
+        self._subscribe(Locations.GUI_STATE_BP_SELECTION.value, self._distinguisher.distinguishBpSelect, _GROUP_SETUP)
+        self._subscribeMulti(Locations.GUI_TEMPTEXT.value,      self._distinguisher.distinguishStart, _GROUP_SETUP)
+        self._subscribe(Locations.POPUP_BOX.value,              self._distinguisher.distinguishPopup, _GROUP_MATCH)
         # stuff processed by abstractions
         self._subscribe(Locations.CURSOR_POS.value, self.cursor.updateCursorPos)
-        self._subscribe(Locations.FRAMECOUNT.value, self.timer.updateFramecount)
+        self._subscribe(Locations.FRAMECOUNT.value, self.timer.updateFramecount, _GROUP_CLOCK)
         # ##
+        self._subscriptions.apply(self._subscriptionGroups())
+        logger.debug("Subscription plan:\n%s", self._subscriptions.report())
 
         # initially paused, because in state WAITING_FOR_NEW
         self._dolphin.pause()
         self._setState(PbrStates.WAITING_FOR_NEW)
         self._lastInput = WiimoteButton.TWO  # to be able to click through the menu
 
-    def _subscribe(self, loc, callback):
-        self._dolphin._subscribe(loc.length*8, loc.addr, callback)
+    def _subscribe(self, loc, callback, group=None):
+        self._subscriptions.add(loc, callback, group=group)
 
-    def _subscribeMulti(self, loc, callback):
-        self._dolphin._subscribeMulti(loc.length, loc.addr, callback)
+    def _subscribeMulti(self, loc, callback, group=None):
+        self._subscriptions.add(loc, callback, multi=True, group=group)
 
-    def _subscribeMultiList(self, length, loc, callback):
-        # used for a list/deque of strings
+    def _subscribeMultiList(self, length, loc, callback, group=None):
+        # used for a list/deque of strings.
+        # the callback gets the index of the string as <index>
         for i in range(length):
-            self._dolphin._subscribeMulti(loc.length, loc.addr+loc.length*i,
-                                          callback)
+            self._subscriptions.add(Loc(loc.addr+loc.length*i, loc.length),
+                                    partial(callback, index=i), multi=True,
+                                    group=group)
+
+    def _subscriptionGroups(self):
+        '''
+        Returns the subscription groups needed in the current state.
+        The match group already gets activated at the point of no return,
+        so the initial (old) data arrives while it still gets ignored.
+        '''
+        groups = []
+        if self.timer.exact:
+            groups.append(_GROUP_CLOCK)
+        if self.state != PbrStates.MATCH_RUNNING:
+            groups.append(_GROUP_SETUP)
+        if PbrStates.PREPARING_START <= self.state <= PbrStates.MATCH_RUNNING:
+            groups.append(_GROUP_MATCH)
+        return groups
+
+    def _read32(self, addr):
+        '''Reads a 32 bit value and blocks until the result arrived.'''
+        result = AsyncResult()
+        self._dolphin.read32(addr, result.set)
+        return result.get()
+
+    def _readMulti(self, addr, size):
+        '''Reads <size> bytes and blocks until the result arrived.'''
+        result = AsyncResult()
+        self._dolphin.readMulti(addr, size, result.set)
+        return bytes(result.get())
 
     def _reconnect(self, watcher, reason):
         if (reason == dolphinWatch.DisconnectReason.CONNECTION_CLOSED_BY_HOST):
@@ -263,6 +407,9 @@ class PBREngine():
         self._fBpPage2 = False
         self._blueExpectedActionCause = ActionCause.OTHER
         self._redExpectedActionCause = ActionCause.OTHER
+        # a savestate might get loaded, which replaces all texts
+        self._infoText.reset()
+        self._effTexts.reset()
 
     ####################################################
     # The below functions are presented to the outside #
@@ -320,32 +467,116 @@ class PBREngine():
             self._fSkipWaitForNew = True
 
         self.colosseum = colosseum
-        # just use whatever positions, not needed anymore
-        #self._posBlues = [int(p["position"]) for p in pkmn_blue]
-        #self._posReds = [int(p["position"]) for p in pkmn_red]
-        self._posBlues = list(range(len(pkmn_blue)))
-        self._posReds = list(range(len(pkmn_blue), len(pkmn_blue)+len(pkmn_red)))
         self.match.new(pkmn_blue, pkmn_red)
+        # encode in the background, the blobs are needed on injection
+        self._teamBlobs = gevent.get_hub().threadpool.spawn(
+            self._encodeTeams, pkmn_blue + pkmn_red)
         self.avatar_blue = avatar_blue
         self.avatar_red = avatar_red
         self.announcer = announcer
 
-        # try to load savestate
+        # try to load the savestate furthest into the preparation.
         # if that succeeds, skip a few steps
-        self._setState(PbrStates.EMPTYING_BP2)
+        base = ("base", announcer)
+        known = self.savestates.hashed(base)
+        keys = [base]
+        # the battle passes closest to what is needed first
+        passes = [k for k in self.savestates.keys("bp", announcer, avatar_blue)
+                  if k[4] == avatar_red]
+        keys[:0] = sorted(passes, key=lambda k: abs(k[3] - len(pkmn_blue))
+                          + abs(k[5] - len(pkmn_red)))
+        # before start() gets to reorder the teams
+        self._snapshotKey = self._teamKey() if self.team_snapshots else None
+        if self._snapshotKey:
+            keys.insert(0, self._snapshotKey)
+        key = self.savestates.find(keys)
+        # what sits on the battle passes in that savestate, if known
+        if key and key[0] == "team":
+            self._bpCounts = {avatar_blue: len(pkmn_blue),
+                              avatar_red: len(pkmn_red)}
+        elif key and key[0] == "bp":
+            self._bpCounts = {key[2]: key[3], key[4]: key[5]}
+        else:
+            self._bpCounts = {}
+        first = self._planBattlePasses()
+        if key is None and known:
+            # known, but failed the integrity check. Don't even try to load it,
+            # create it again. The game is still paused from WAITING_FOR_NEW
+            self._dolphin.resume()
+            self._setState(PbrStates.CREATING_SAVE1)
+            self._newRng()
+            self._dolphin.volume(0)
+            return
+        if key and key[0] == "team":
+            # everything is prepared, just wait for the order selection
+            self._setState(PbrStates.PREPARING_START)
+            filename = self.savestates.path(key)
+        else:
+            self._setState(first)
+            filename = self.savestates.path(key) if key else \
+                self._savefile1 if announcer else self._savefile2
         self._dolphin.resume()
-        loaded_success = self._dolphin.load(self._savefile1 if announcer
-                                            else self._savefile2)
+        loaded_success = self._dolphin.load(filename)
         # wait until loaded, just to be sure
         self.timer.sleep(80)
         if not loaded_success:
+            if key:
+                self.savestates.remove(key)
+            self._bpCounts = {}
+            self._planBattlePasses()
             self._setState(PbrStates.CREATING_SAVE1)
         else:
+            if key is None and base not in self.savestates:
+                # made before savestates got hashed, hash it from now on
+                self.savestates.add(base, filename, pinned=True)
             self._setAnimSpeed(self._increasedSpeed)
 
         self._newRng()  # avoid patterns (e.g. always fog at courtyard)
         self._dolphin.volume(0)
 
+    def _planBattlePasses(self):
+        '''
+        Decides how many pokemon need to be removed from and added to each
+        battle pass, based on what is known to sit on them. Their contents
+        don't matter, the injection overwrites them. Passes already holding
+        as many pokemon as the team has are skipped entirely.
+        Returns the first state with something to do.
+        '''
+        self._bpPlan = {}
+        for emptying, preparing, avatar, prev, team in (
+                (PbrStates.EMPTYING_BP2, PbrStates.PREPARING_BP2,
+                 self.avatar_red, self._prev_avatar_red, self.match.pkmn_red),
+                (PbrStates.EMPTYING_BP1, PbrStates.PREPARING_BP1,
+                 self.avatar_blue, self._prev_avatar_blue,
+                 self.match.pkmn_blue)):
+            count = self._bpCounts.get(avatar)
+            if count is None:
+                # assume only the pass used last time holds pokemon.
+                # None means until it is empty
+                self._bpPlan[emptying] = [prev, None]
+                count = 0
+            else:
+                self._bpPlan[emptying] = [avatar, max(0, count - len(team))]
+            self._bpPlan[preparing] = [avatar, max(0, len(team) - count)]
+        # just use whatever positions, not needed anymore
+        blues = self._bpPlan[PbrStates.PREPARING_BP1][1]
+        reds = self._bpPlan[PbrStates.PREPARING_BP2][1]
+        self._posBlues = list(range(blues))
+        self._posReds = list(range(blues, blues + reds))
+        return next((state for state, (_, todo) in sorted(self._bpPlan.items())
+                     if todo != 0), PbrStates.PREPARING_STAGE)
+
+    def _teamKey(self):
+        '''
+        Savestate key of a match fully prepared up to the order selection.
+        Canonical, so equal teams always give the same key.
+        '''
+        setup = [int(self.colosseum), int(self.avatar_blue),
+                 int(self.avatar_red), self.match.pkmn_blue, self.match.pkmn_red]
+        digest = hashlib.sha1(json.dumps(setup, sort_keys=True, default=str)
+                              .encode()).hexdigest()
+        return ("team", self.announcer, digest)
+
     def cancel(self):
         '''
         Cancels the current/upcoming match.
@@ -372,6 +603,7 @@ class PBREngine():
         '''
         self.speed = s
         self._dolphin.speed(s)
+        self._updateClockMode()
 
     def setFov(self, val=0.5):
         '''
@@ -419,15 +651,62 @@ class PBREngine():
         if val == 1.0:
             self._resetAnimSpeed()
         else:
+            self._animSpeed = val
             self._dolphin.write32(Locations.SPEED_1.value.addr, 0)
             self._dolphin.write32(Locations.SPEED_2.value.addr, floatToIntRepr(val))
+            self._updateClockMode()
 
     def _resetAnimSpeed(self):
         '''
         Sets the game's animation speed back to its default.
         '''
+        self._animSpeed = 1.0
         self._dolphin.write32(Locations.SPEED_1.value.addr, DefaultValues["SPEED1"])
         self._dolphin.write32(Locations.SPEED_2.value.addr, DefaultValues["SPEED2"])
+        self._updateClockMode()
+
+    def _updateClockMode(self):
+        '''
+        Allows the timer to only sample the framecount if the game runs
+        with increased animation and emulation speed, because that's when
+        getting every single frame reported is the most expensive.
+        '''
+        self.timer.setCoarse(self._clockResolution is not None and
+                             self._animSpeed > 1.0 and self.speed > 1.0)
+
+    def _clockModeChanged(self, exact):
+        if self._subscriptions:
+            self._subscriptions.setActive(self._subscriptionGroups())
+        if not exact and not self._clockPoller:
+            self._clockPoller = gevent.spawn(self._pollFramecount)
+
+    def _pollFramecount(self):
+        '''
+        Shall be spawned as a Greenlet.
+        Samples the framecount every <clock_resolution> seconds for as long
+        as the timer doesn't need exact updates.
+        '''
+        try:
+            while not self.timer.exact:
+                self.timer.updateFramecount(
+                    self._read32(Locations.FRAMECOUNT.value.addr))
+                gevent.sleep(self._clockResolution)
+        finally:
+            self._clockPoller = None
+
+    def _pollBattleState(self):
+        '''
+        Shall be spawned as a Greenlet when the match starts.
+        Refreshes battle_state every <battle_state_interval> frames.
+        '''
+        while self.state == PbrStates.MATCH_RUNNING:
+            changes = []
+            for side, addr, length in self.battle_state.regions():
+                changes += self.battle_state.update(
+                    side, self._readMulti(addr, length), self.timer.frame)
+            if changes:
+                self.on_battle_state(changes=changes)
+            self.timer.sleep(self.battle_state_interval)
 
     def _switched(self, side, monindex):
         self.on_switch(side=side, monindex=monindex,
@@ -455,6 +734,7 @@ class PBREngine():
             if self.gui == PbrGuis.RULES_BPS_CONFIRM:
                 limit = 600  # don't interrupt the injection
             if (self.timer.frame - self._lastInputFrame) > limit:
+                self.on_stuck(button=self._lastInput)
                 self._pressButton(self._lastInput)
 
     def _pressButton(self, button):
@@ -486,6 +766,8 @@ class PBREngine():
         if self.state == state:
             return
         self.state = state
+        if self._subscriptions:
+            self._subscriptions.setActive(self._subscriptionGroups())
         self.on_state(state=state)
 
     def _newRng(self):
@@ -493,23 +775,62 @@ class PBREngine():
         self._dolphin.write32(Locations.RNG_SEED.value.addr, random.getrandbits(32))
 
 
+    def _pokemonBlob(self, pkmn_dict):
+        if self.blob_store:
+            blob = self.blob_store.get(pkmn_dict)
+            if blob is not None:
+                return blob
+        return get_pokemon_blob(pkmn_dict)
+
+    def _encodeTeams(self, pkmn):
+        '''
+        Runs in the threadpool, so the hub never waits for the encoding.
+        Returns a dict id(pokemon dict) -> blob.
+        '''
+        return {id(pkmn_dict): self._pokemonBlob(pkmn_dict)
+                for pkmn_dict in pkmn}
+
     def _injectPokemon(self):
-        # BPStructOffsets
-        pointer = AsyncResult()
-        self._dolphin.read32(Locations.POINTER_BP_STRUCT.value.addr, pointer.set)
-        pointer = pointer.get()
-        
-        for offset, data in ((BPStructOffsets.PKMN_BLUE, self.match.pkmn_blue), (BPStructOffsets.PKMN_RED, self.match.pkmn_red)):
-            for poke_i, pkmn_dict in enumerate(data):
-                pokemon = get_pokemon_from_data(pkmn_dict)
-                pokebytes = pokemon.to_bytes()
-                self._dolphin.pause()
-                gevent.sleep(0.1)
-                for i, byte in enumerate(pokebytes):
-                    self._dolphin.write8(pointer + offset + i + poke_i*0x8c, byte)
-                gevent.sleep(0.1)
-                self._dolphin.resume()
-                self.timer.sleep(20)
+        '''
+        Writes both teams into the battle pass struct in one go.
+        Each team is written with a single writeMulti, the gaps between the
+        pokemon blobs are filled with what was read from memory beforehand.
+        Afterwards everything gets read back and compared.
+        Returns True if the read back data matches what was written.
+        '''
+        pointer = self._read32(Locations.POINTER_BP_STRUCT.value.addr)
+        # normally done long ago. Only blocks this greenlet if not
+        encoded = self._teamBlobs.get() if self._teamBlobs else {}
+
+        teams = []
+        for offset, data in ((BPStructOffsets.PKMN_BLUE, self.match.pkmn_blue),
+                             (BPStructOffsets.PKMN_RED, self.match.pkmn_red)):
+            if not data:
+                continue
+            blobs = [encoded.get(id(pkmn_dict)) or self._pokemonBlob(pkmn_dict)
+                     for pkmn_dict in data]
+            teams.append((pointer + offset, blobs))
+
+        self._dolphin.pause()
+        gevent.sleep(0.1)
+        expected = []
+        for addr, blobs in teams:
+            length = _BP_PKMN_STRIDE * (len(blobs) - 1) + len(blobs[-1])
+            region = bytearray(self._readMulti(addr, length))
+            for poke_i, pokebytes in enumerate(blobs):
+                start = poke_i * _BP_PKMN_STRIDE
+                region[start:start+len(pokebytes)] = pokebytes
+            self._dolphin.writeMulti(addr, list(region))
+            expected.append((addr, length, hashlib.md5(region).digest()))
+        # read everything back to catch writes that got lost
+        success = True
+        for addr, length, digest in expected:
+            written = self._readMulti(addr, length)
+            if hashlib.md5(written).digest() != digest:
+                logger.warning("Injected pokemon data at %x doesn't match", addr)
+                success = False
+        self._dolphin.resume()
+        return success
 
     def pkmnIndexToButton(self, index):
         # TODO fix sideways remote
@@ -541,6 +862,8 @@ class PBREngine():
             self._posBlues.pop(0)
         else:
             self._posReds.pop(0)
+        bp = self._bpPlan[self.state][0]
+        self._bpCounts[bp] = self._bpCounts.get(bp, 0) + 1
         cursor = CursorOffsets.BP_SLOTS - 1 + self._bp_offset
         self.cursor.addEvent(cursor, self._distinguishBpSlots)
 
@@ -562,8 +885,16 @@ class PBREngine():
         '''
         self._setAnimSpeed(self.match_speed)
         # mute the "whoosh" as well
-        self.timer.spawn_later(330, self._dolphin.volume, self.volume)
-        self.timer.spawn_later(450, self._disableBlur)
+        # keep the handles, a quick match must not disable the blur
+        # after it got reset again
+        self._matchStartJobs = [
+            self.timer.spawn_later(330, self._dolphin.volume, self.volume),
+            self.timer.spawn_later(450, self._disableBlur),
+        ]
+        self.battle_state.reset()
+        if self.battle_state_interval:
+            self._matchStartJobs.append(self.timer.spawn_later(
+                self.battle_state_interval, self._pollBattleState))
         # match is running now
         self._setState(PbrStates.MATCH_RUNNING)
 
@@ -597,6 +928,9 @@ class PBREngine():
         Next state can either be waiting for a new match selection (pause),
         or directly starting one.
         '''
+        for job in self._matchStartJobs:
+            job.cancel()
+        self._matchStartJobs = []
         self._dolphin.volume(0)
         self._resetBlur()
         self._select(3)
@@ -789,12 +1123,6 @@ class PBREngine():
             self._pressTwo()
             self.timer.sleep(20)
 
-    def _invalidateEffTexts(self):
-        for i in range(9):
-            self._dolphin.write32(Locations.EFFECTIVE_TEXT.value.addr +
-                                  Locations.EFFECTIVE_TEXT.value.length * i,
-                                  0x00230023)
-
     def _select_bp(self, num):
         index = CursorOffsets.BPS + (num % 4)
         if not self._fBpPage2 and num >= 4:
@@ -823,14 +1151,7 @@ class PBREngine():
                                              "monindex": current_index})
 
     def _distinguishStatus(self, val, side):
-        status = {
-            0x00: None,
-            0x08: "psn",
-            0x10: "brn",
-            0x20: "frz",
-            0x40: "par",
-            0x80: "tox"  # badly poisoned
-        }.get(val, "slp")  # slp can be 0x01-0x07
+        status = battlestate.statusName(val)
         current_index = self.match.current_blue if side == "blue" else self.match.current_red
         if status == "slp":
             # include rounds remaining on sleep
@@ -840,21 +1161,19 @@ class PBREngine():
             self.on_stat_update(type="status", data={"status": status, "side": side,
                                                      "monindex": current_index})
 
-    def _distinguishEffective(self, data):
+    def _distinguishEffective(self, data, index):
         # Just for the logging. Can also be "critical hit"
         if self.state != PbrStates.MATCH_RUNNING:
             return
         # move gui back into place. Don't hide this even with hide_gui set
         self.setGuiPosY(DefaultValues["GUI_POS_Y"])
-        text = bytesToString(data)
-        # skip text invalidations
-        if text.startswith("##"):
+        # skip text invalidations. The tracker also makes sure the next
+        # message gets noticed, even if it's the same text again
+        if not self._effTexts.seen(data, index):
             return
+        text = bytesToString(data)
         self.on_infobox(text=text)
-        # this text gets instantly changed, so change it after it's gone.
-        # this number of frames is a wild guess.
-        # Longer than "A critical hit! It's super effective!"
-        self.timer.spawn_later(240, self._invalidateEffTexts)
+        self.on_battle_event(event=classify(text))
 
     def _distinguishPkmnMenu(self, val):
         self._fGuiPkmnUp = False
@@ -873,23 +1192,28 @@ class PBREngine():
         if self.state != PbrStates.MATCH_RUNNING:
             return
 
+        # only attack declarations are of interest, don't decode anything else
+        if not _TEAM_PREFIXES.prefix(data):
+            return
+
         # 2nd line starts 0x40 bytes later and contains the move name only
         line = bytesToString(data[:0x40]).strip()
         # convert, then remove "!"
         move = bytesToString(data[0x40:]).strip()[:-1]
 
-        match = re.search(r"^Team (Blue|Red)'s (.*?) use(d)", line)
-        if match:
+        event = classify("%s %s!" % (line, move))
+        if event.kind == BattleEvents.MOVE:
+            self.on_battle_event(event=event)
             # invalidate the little info boxes here.
             # I think there will always be an attack declared between 2
             # identical texts ("But it failed" for example)
             # => No need for timed invalidation
-            self._dolphin.write32(Locations.INFO_TEXT.value.addr, 0x00230023)
+            self._infoText.invalidate()
 
             # "used" => "uses", so we get the event again if something changes!
             self._dolphin.write8(Locations.ATTACK_TEXT.value.addr + 1 +
-                                 2 * match.start(3), 0x73)
-            side = match.group(1).lower()
+                                 2 * (line.rfind("used") + 3), 0x73)
+            side = event.side
             self.match.setLastMove(side, move)
             # reset fails counter
             self._failsMoveSelection = 0
@@ -917,24 +1241,24 @@ class PBREngine():
         if self.state != PbrStates.MATCH_RUNNING:
             return
 
-        string = bytesToString(data)
-        
         # skip text invalidation
-        if string.startswith("##"):
+        if not self._infoText.seen(data):
             return
 
+        string = bytesToString(data)
+
         # shift gui up a bit to fully see this
         self.setGuiPosY(DefaultValues["GUI_POS_Y"] + 20.0)
 
         # log the whole thing
         self.on_infobox(text=string)
+        event = classify(string)
+        self.on_battle_event(event=event)
 
         # CASE 1: Someone fainted.
-        match = re.search(r"^Team (Blue|Red)'s (.+?) fainted!$",
-                          string)
-        if match:
-            side = match.group(1).lower()
-            self.match.fainted(side, match.group(2))
+        if event.kind == BattleEvents.FAINTED:
+            side = event.side
+            self.match.fainted(side, event.pkmn)
             if side == "blue":
                 self._blueExpectedActionCause = ActionCause.FAINT
             elif side == "red":
@@ -942,11 +1266,8 @@ class PBREngine():
             return
 
         # CASE 2: Roar or Whirlwind caused a undetected pokemon switch!
-        match = re.search(
-            r"^Team (Blue|Red)'s (.+?) was dragged out!$", string)
-        if match:
-            side = match.group(1).lower()
-            self.match.draggedOut(side, match.group(2))
+        if event.kind == BattleEvents.DRAGGED_OUT:
+            self.match.draggedOut(event.side, event.pkmn)
             return
         
         # update the win detection for each (unprocessed) message.
@@ -967,12 +1288,19 @@ class PBREngine():
         # reset fails counter
         self._failsMoveSelection = 0
 
+    def _removedPkmn(self, plan):
+        bp, todo = plan
+        if todo:
+            plan[1] = todo - 1
+        if self._bpCounts.get(bp):
+            self._bpCounts[bp] -= 1
+
     def _distinguishBpSlots(self):
         # Decide what to do if we are looking at a battle pass...
         # Chronologically: clear #2, clear #1, fill #1, fill #2
         if self.state <= PbrStates.EMPTYING_BP2:
             # We are still in the state of clearing the 2nd battle pass
-            if self._fClearedBp:
+            if self._fClearedBp or self._bpPlan[self.state][1] == 0:
                 # There are no pokemon on this battle pass left
                 # Go back and start emptying battle pass #1
                 self._pressOne()
@@ -984,7 +1312,7 @@ class PBREngine():
         elif self.state == PbrStates.EMPTYING_BP1:
             # There are still old pokemon on blue's battle pass. Grab that.
             # Triggers gui BPS_PKMN_GRABBED
-            if self._fClearedBp:
+            if self._fClearedBp or self._bpPlan[self.state][1] == 0:
                 self._fClearedBp = False
                 self._setState(self.state + 1)
                 self._pressOne()
@@ -1012,28 +1340,49 @@ class PBREngine():
             self._resetAnimSpeed()
             # wait for game to stabilize. maybe this causes the load fails.
             gevent.sleep(0.5)
-            self._dolphin.save(self._savefile1 if self.announcer !=
-                               (self.state == PbrStates.CREATING_SAVE1)
-                               else self._savefile2)
+            withAnnouncer = self.announcer != \
+                (self.state == PbrStates.CREATING_SAVE1)
+            filename = self._savefile1 if withAnnouncer else self._savefile2
+            self._dolphin.save(filename)
             gevent.sleep(1.0)  # I don't think this caused the saves to go corrupt, but better be save
+            self.savestates.add(("base", withAnnouncer), filename, pinned=True)
             self._setAnimSpeed(self._increasedSpeed)
             self._fSetAnnouncer = False
             self._setState(self.state + 1)
 
-        if self.state == PbrStates.EMPTYING_BP2:
-            self._fClearedBp = False
-            self._select_bp(self._prev_avatar_red)
-        elif self.state == PbrStates.EMPTYING_BP1:
+        # skip the battle passes that are fine already
+        while self.state in self._bpPlan and self._bpPlan[self.state][1] == 0:
+            self._setState(self.state + 1)
+
+        blue = self._bpCounts.get(self.avatar_blue)
+        red = self._bpCounts.get(self.avatar_red)
+        key = ("bp", self.announcer, self.avatar_blue, blue, self.avatar_red, red)
+        if self.state in (PbrStates.PREPARING_BP1, PbrStates.PREPARING_STAGE) \
+                and self._bpPlan and None not in (blue, red) and \
+                key not in self.savestates:
+            # Save these battle passes, so the next match with the same
+            # avatars only needs to change what's different
+            self._resetAnimSpeed()
+            gevent.sleep(0.5)
+            filename = self.savestates.path(key)
+            self._dolphin.save(filename)
+            gevent.sleep(1.0)
+            self.savestates.add(key, filename)
+            self._setAnimSpeed(self._increasedSpeed)
+
+        if self.state in (PbrStates.EMPTYING_BP2, PbrStates.EMPTYING_BP1):
             self._fClearedBp = False
-            self._select_bp(self._prev_avatar_blue)
-        elif self.state == PbrStates.PREPARING_BP1:
-            self._select_bp(self.avatar_blue)
-        elif self.state == PbrStates.PREPARING_BP2:
-            self._prev_avatar_blue = self.avatar_blue
-            self._prev_avatar_red = self.avatar_red
-            self._select_bp(self.avatar_red)
+            self._select_bp(self._bpPlan[self.state][0])
+        elif self.state in (PbrStates.PREPARING_BP1, PbrStates.PREPARING_BP2):
+            # new pokemon go behind the ones already there
+            bp = self._bpPlan[self.state][0]
+            self._bp_offset = self._bpCounts.get(bp, 0)
+            self._select_bp(bp)
         else:
             # done preparing or starting to prepare savestates
+            if self.state == PbrStates.PREPARING_STAGE and self._bpPlan:
+                self._prev_avatar_blue = self.avatar_blue
+                self._prev_avatar_red = self.avatar_red
             self._pressOne()
 
     def _distinguishGui(self, gui):
@@ -1143,10 +1492,14 @@ class PBREngine():
                 self._distinguishBpSlots()
         elif gui == PbrGuis.BPS_PKMN_GRABBED:
             self._select(CursorPosBP.REMOVE)
+            if self.state in self._bpPlan:
+                self._removedPkmn(self._bpPlan[self.state])
         elif gui == PbrGuis.BPS_BOXES and\
                 self.state < PbrStates.PREPARING_START:
             self._fEnteredBp = True
             self._fClearedBp = True
+            if self.state in (PbrStates.EMPTYING_BP2, PbrStates.EMPTYING_BP1):
+                self._bpCounts[self._bpPlan[self.state][0]] = 0
             #if self.state == PbrStates.EMPTYING_BP1:
             #    self._setState(PbrStates.PREPARING_BP1)
                 # no need to go back to bp selection first, short-circuit
@@ -1199,9 +1552,13 @@ class PBREngine():
         elif gui == PbrGuis.RULES_BATTLE_STYLE:
             self._select(1)
         elif gui == PbrGuis.RULES_BPS_CONFIRM:
-            # twice, just to be sure as I have seen it fail once
-            self._injectPokemon()
-            self._injectPokemon()
+            # injection gets verified. only repeat it if that failed,
+            # as I have seen it fail once
+            for _ in range(3):
+                if self._injectPokemon():
+                    break
+            else:
+                logger.error("Injecting the pokemon failed repeatedly")
             self._pressTwo()
             # skip the followup match intro
             gevent.spawn_later(1, self._skipIntro)
@@ -1230,6 +1587,17 @@ class PBREngine():
             logger.debug("ORDER_SELECT. startsignal: {}, state: {}"
                            .format(self.startsignal, self.state))
 
+            key = self._snapshotKey
+            if key and self.state == PbrStates.PREPARING_START and \
+                    key not in self.savestates:
+                # save the prepared teams for a rematch
+                self._resetAnimSpeed()
+                gevent.sleep(0.5)
+                filename = self.savestates.path(key)
+                self._dolphin.save(filename)
+                gevent.sleep(1.0)
+                self.savestates.add(key, filename)
+
             if self.startsignal:
                 # start() was called.  Match needs to start, so
                 # initiate order selection.
@@ -6,21 +6,44 @@ https://github.com/TwitchPlaysPokemon/pokerevo/tree/master/utils/libeps
 
 import random
 import time
+import importlib
 from gevent.event import AsyncResult
 
 import dolphinWatch
 
 try:
-    from factory import get_pokemon_from_data
-    from adapter import Savefile, Pokemon
-    from eps import EPSM_ACTIVE_SAVEFILE, EPSM_BACKUP_SAVEFILE, EPSM_WRITE_BOTH_READ_ACTIVE, EPSM_WRITE_BOTH_READ_BACKUP
+    from factory import get_pokemon_from_data, get_pokemon_bytes, get_pokemon_blob, blob_cache_info, set_blob_cache_size, invalidate_blob_cache
+    from blobstore import BlobStore
+    from codec import encode, encode_many, decode, decode_many, check_parity
 except ImportError:
-    from .factory import get_pokemon_from_data
-    from .adapter import Savefile, Pokemon
-    from .eps import EPSM_ACTIVE_SAVEFILE, EPSM_BACKUP_SAVEFILE, EPSM_WRITE_BOTH_READ_ACTIVE, EPSM_WRITE_BOTH_READ_BACKUP
+    from .factory import get_pokemon_from_data, get_pokemon_bytes, get_pokemon_blob, blob_cache_info, set_blob_cache_size, invalidate_blob_cache
+    from .blobstore import BlobStore
+    from .codec import encode, encode_many, decode, decode_many, check_parity
+
+# these load libeps, which only the encoding through libeps needs.
+# get imported on first access, so using just a blob store and the codec
+# works without libeps.
+_LIBEPS_NAMES = {
+    "Savefile": "adapter", "Pokemon": "adapter", "PokemonPool": "adapter",
+    "EPSM_ACTIVE_SAVEFILE": "eps", "EPSM_BACKUP_SAVEFILE": "eps",
+    "EPSM_WRITE_BOTH_READ_ACTIVE": "eps", "EPSM_WRITE_BOTH_READ_BACKUP": "eps",
+}
+
+
+def __getattr__(name):
+    if name not in _LIBEPS_NAMES:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    module = importlib.import_module("." + _LIBEPS_NAMES[name], __name__)
+    value = getattr(module, name)
+    globals()[name] = value
+    return value
 
 
 def test1():
+    try:
+        from adapter import Savefile, Pokemon
+    except ImportError:
+        from .adapter import Savefile, Pokemon
     testfile = "G:/TPP/tests/PbrSaveData"
     sf = Savefile(testfile)
     sf.save_slot = 1
@@ -51,6 +74,10 @@ def test1():
 
 
 def dump():
+    try:
+        from adapter import Savefile, Pokemon
+    except ImportError:
+        from .adapter import Savefile, Pokemon
     testfile = "G:/TPP/PbrSaveData"
     sf = Savefile(testfile)
     sf.save_slot = 1
@@ -60,6 +87,10 @@ def dump():
 
 
 def test2():
+    try:
+        from adapter import Pokemon
+    except ImportError:
+        from .adapter import Pokemon
     p = Pokemon("G:/TPP/tests/template_pokemon2.eps")
     species = random.randint(1, 493)
     print("Species: %d" % species)
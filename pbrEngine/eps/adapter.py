@@ -1,6 +1,7 @@
 # source code owned by Twitch Plays Pokemon AUTHORIZED USE ONLY see LICENSE.MD
 
 from ctypes import *
+from contextlib import contextmanager
 try:
     from eps import *
     from errors import check_throw_error
@@ -85,6 +86,9 @@ class Pokemon:
         If filepath_or_save is a Savefile object, reads a pokemon from
             the supplied savefile. The arguments box and pos are required.
         If filepath_or_save is a filepath, reads the pokemon from a file.
+        If filepath_or_save is bytes, reads the pokemon from those 0x88 bytes.
+        The native memory gets freed by close(), or when used as a context
+        manager, instead of whenever the garbage collector gets to it.
         '''
         self.filepath_or_save = filepath_or_save
         self.box = box
@@ -99,6 +103,9 @@ class Pokemon:
                 raise ValueError("If the pokemon object gets passed a savefile, the arguments "
                                  " box and pos are required!")
             ec = epsf_read_pokemon_from_save(filepath_or_save._save, box, pos, byref(self._pokemon))
+        elif isinstance(filepath_or_save, (bytes, bytearray)):
+            # read from memory
+            ec = epsf_read_pokemon_from_buffer(bytes(filepath_or_save), byref(self._pokemon))
         else:
             # read from file
             ec = epsf_read_pokemon_from_file(filepath_or_save.encode(), byref(self._pokemon))
@@ -108,7 +115,30 @@ class Pokemon:
         self._moves = tuple(Move(self, i+1) for i in range(4))
 
     def __del__(self):
-        epsf_destroy_pokemon(self._pokemon)
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        '''Frees the native pokemon. The object is unusable afterwards.'''
+        if self._pokemon:
+            epsf_destroy_pokemon(self._pokemon)
+            self._pokemon = c_void_p(None)
+
+    def load_bytes(self, data):
+        '''
+        Replaces this pokemon with the one in the 0x88 bytes <data>,
+        e.g. to reset a pooled object to a template.
+        '''
+        pokemon = c_void_p(None)
+        ec = epsf_read_pokemon_from_buffer(bytes(data), byref(pokemon))
+        check_throw_error(ec)
+        self.close()
+        self._pokemon = pokemon
 
     def save(self, filepath_or_save=None, box=None, pos=None):
         '''
@@ -314,3 +344,57 @@ class Pokemon:
     def ball(self, value):
         self._set_value(EPSK_POKE_BALL, 0, value)
 
+
+class PokemonPool:
+    def __init__(self, template, size=4):
+        '''
+        Keeps up to <size> Pokemon objects around for reuse. Each one handed
+        out by acquire() starts out as <template>, a filepath or the 0x88
+        bytes of a pokemon. A template file only gets read once.
+        Usable as a context manager, which closes all pooled pokemon on exit.
+        '''
+        if not isinstance(template, (bytes, bytearray)):
+            with Pokemon(template) as p:
+                template = p.to_bytes()
+        self.template = bytes(template)
+        self.size = size
+        self._free = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def acquire(self):
+        '''Returns a Pokemon reset to the template. Hand it back with release().'''
+        try:
+            p = self._free.pop()
+        except IndexError:
+            return Pokemon(self.template)
+        p.load_bytes(self.template)
+        return p
+
+    def release(self, p):
+        if len(self._free) < self.size:
+            self._free.append(p)
+        else:
+            p.close()
+
+    @contextmanager
+    def pokemon(self):
+        '''
+        Context manager around acquire() and release():
+            with pool.pokemon() as p:
+                p.level = 100
+                data = p.to_bytes()
+        '''
+        p = self.acquire()
+        try:
+            yield p
+        finally:
+            self.release(p)
+
+    def close(self):
+        while self._free:
+            self._free.pop().close()
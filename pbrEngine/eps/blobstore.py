@@ -0,0 +1,138 @@
+"""
+Precompiled pokemon blobs for a whole pokeset catalog in a single file,
+so engines don't have to encode anything at runtime. Build it once with
+
+python -m pbrEngine.eps.blobstore <pokesets.json|.yaml> <output.blobs>
+
+and open it with BlobStore. The file gets memory mapped read only, so all
+engine processes on the host share the same pages.
+
+File layout, all big endian:
+a header with magic, stride, blob count and the offset of the index,
+the blobs at a fixed stride starting at HEADER_SIZE, then the index as
+json: {"keys": {content key: slot}, "names": {ingamename: [slots]}}.
+"""
+
+import os
+import json
+import mmap
+import struct
+import hashlib
+import multiprocessing
+try:
+    from factory import get_pokemon_bytes, _blob_key
+except ImportError:
+    from .factory import get_pokemon_bytes, _blob_key
+
+MAGIC = b"PBRBLOB1"
+HEADER_SIZE = 0x20
+_HEADER = ">8sIIQ"  # magic, stride, count, index offset
+
+
+def content_key(data):
+    '''Key of a pokeset in the index, derived from all encoded fields.'''
+    return hashlib.sha1(repr(_blob_key(data)).encode("utf-8")).hexdigest()
+
+
+def _encode_chunk(pokesets):
+    return [(content_key(data), data["ingamename"],
+             get_pokemon_bytes(data)) for data in pokesets]
+
+
+def build(pokesets, filename, processes=None, chunksize=64):
+    '''
+    Encodes all <pokesets> with libeps, spread over <processes> worker
+    processes (default: one per cpu), and writes the blob file.
+    Identical pokesets are stored once. Returns the number of blobs.
+    '''
+    chunks = [pokesets[i:i+chunksize]
+              for i in range(0, len(pokesets), chunksize)]
+    with multiprocessing.Pool(processes) as pool:
+        encoded = [entry for chunk in pool.map(_encode_chunk, chunks)
+                   for entry in chunk]
+    keys = {}
+    names = {}
+    blobs = []
+    for key, name, blob in encoded:
+        if key not in keys:
+            keys[key] = len(blobs)
+            names.setdefault(name, []).append(len(blobs))
+            blobs.append(blob)
+    stride = max((len(blob) for blob in blobs), default=0)
+    index = json.dumps({"keys": keys, "names": names}).encode("utf-8")
+    index_offset = HEADER_SIZE + stride * len(blobs)
+    with open(filename + ".tmp", "wb") as f:
+        f.write(struct.pack(_HEADER, MAGIC, stride, len(blobs), index_offset)
+                .ljust(HEADER_SIZE, b"\0"))
+        for blob in blobs:
+            f.write(blob.ljust(stride, b"\0"))
+        f.write(index)
+    # don't leave a half written file behind for running engines to map
+    os.replace(filename + ".tmp", filename)
+    return len(blobs)
+
+
+class BlobStore(object):
+    '''
+    Read only view of a file written by build().
+    get() returns memoryviews into the mapped file, no bytes get copied.
+    '''
+    def __init__(self, filename):
+        with open(filename, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.stride, self._count, index_offset = \
+            struct.unpack_from(_HEADER, self._mmap, 0)
+        if magic != MAGIC:
+            self._mmap.close()
+            raise ValueError("Not a blob file: %s" % filename)
+        index = json.loads(self._mmap[index_offset:].decode("utf-8"))
+        self._keys = index["keys"]
+        self._names = index["names"]
+        self._view = memoryview(self._mmap)
+
+    def __len__(self):
+        return self._count
+
+    def _slot(self, slot):
+        start = HEADER_SIZE + slot * self.stride
+        return self._view[start:start+self.stride]
+
+    def get(self, data):
+        '''
+        Returns the blob of the pokeset <data>, the same bytes as
+        get_pokemon_bytes(data), or None if it isn't stored.
+        '''
+        slot = self._keys.get(content_key(data))
+        return None if slot is None else self._slot(slot)
+
+    def by_name(self, ingamename):
+        '''Returns the blobs of all stored pokesets with that ingamename.'''
+        return [self._slot(slot) for slot in self._names.get(ingamename, ())]
+
+    def close(self):
+        self._view.release()
+        self._mmap.close()
+
+
+def _load_pokesets(filename):
+    with open(filename, encoding="utf-8") as f:
+        if not filename.endswith((".yaml", ".yml")):
+            return json.load(f)
+        import yaml
+        pokesets = list(yaml.safe_load_all(f))
+    if all(isinstance(data["ability"], dict) for data in pokesets):
+        return pokesets
+    # raw or populated sets, turn them into instances like main.py does
+    import pokecat
+    return [pokecat.instantiate_pokeset(
+                pokecat.populate_pokeset(data)
+                if isinstance(data["ability"], str) else data)
+            for data in pokesets]
+
+
+if __name__ == "__main__":
+    import sys
+    pokesets = _load_pokesets(sys.argv[1])
+    count = build(pokesets, sys.argv[2])
+    print("%d blobs from %d pokesets written to %s"
+          % (count, len(pokesets), sys.argv[2]))
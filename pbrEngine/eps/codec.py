@@ -0,0 +1,238 @@
+"""
+Encodes and decodes PBR's 0x88 byte pokemon struct in plain python,
+without going through libeps. Produces the same bytes as
+factory.get_pokemon_bytes(data), see check_parity().
+
+The struct is the gen 4 one, big endian and not encrypted:
+a header with the personality value and checksum, followed by 4 blocks
+of 0x20 bytes, shuffled depending on the personality value.
+"""
+
+import struct
+from os import path
+try:
+    from levels import get_experience_points, get_level
+except ImportError:
+    from .levels import get_experience_points, get_level
+
+_root_path = path.abspath(path.dirname(__file__))
+
+SIZE = 0x88
+_BLOCK = 0x20
+
+# all offsets as if the blocks were in order A B C D
+_PV = 0x00
+_CHECKSUM = 0x06
+_SPECIES = 0x08
+_ITEM = 0x0A
+_OT_ID = 0x0C
+_SECRET_ID = 0x0E
+_EXPERIENCE = 0x10
+_FRIENDSHIP = 0x14
+_ABILITY = 0x15
+_EVS = 0x18
+_MOVES = 0x28
+_PP = 0x30
+_PP_UPS = 0x34
+_IVS = 0x38
+_FLAGS = 0x40
+_NAME = 0x48
+_BALL = 0x83
+
+_FATEFUL = 0x80
+_GENDERLESS = 0x40
+_FEMALE = 0x20
+_FORM = 0x1f
+
+_STATS = ("hp", "atk", "def", "spe", "spA", "spD")
+_NAME_LENGTH = 10
+
+# block order for each value of ((pv >> 13) & 31) % 24
+_ORDERS = ("ABCD", "ABDC", "ACBD", "ACDB", "ADBC", "ADCB",
+           "BACD", "BADC", "BCAD", "BCDA", "BDAC", "BDCA",
+           "CABD", "CADB", "CBAD", "CBDA", "CDAB", "CDBA",
+           "DABC", "DACB", "DBAC", "DBCA", "DCAB", "DCBA")
+
+_CHARS = {" ": 0x1de, "!": 0x1ab, '"': 0x1b5, "#": 0x1c0, "$": 0x1a8,
+          "%": 0x1d2, "&": 0x1c2, "'": 0x1b3, "(": 0x1b9, ")": 0x1ba,
+          "*": 0x1bf, "+": 0x1bd, ",": 0x1ad, "-": 0x1be, ".": 0x1ae,
+          "/": 0x1b1, ":": 0x1c4, ";": 0x1c5, "=": 0x1c1, "?": 0x1ac,
+          "@": 0x1d0, "_": 0x1e9, "{": 0x1b7, "}": 0x1b8, "~": 0x1c3,
+          "♂": 0x1bb, "♀": 0x1bc}
+_CHARS.update((chr(ord("0") + i), 0x121 + i) for i in range(10))
+_CHARS.update((chr(ord("A") + i), 0x12b + i) for i in range(26))
+_CHARS.update((chr(ord("a") + i), 0x145 + i) for i in range(26))
+_CODES = {code: char for char, code in _CHARS.items()}
+# libeps' spelling of the gender symbols
+_CHARS["<"] = _CHARS["♂"]
+_CHARS[">"] = _CHARS["♀"]
+
+
+def _shuffle(data, pv, unshuffle=False):
+    order = _ORDERS[((pv >> 13) & 31) % 24]
+    result = bytearray(data)
+    for position, block in enumerate(order):
+        shuffled = 8 + position * _BLOCK
+        ordered = 8 + "ABCD".index(block) * _BLOCK
+        if unshuffle:
+            result[ordered:ordered+_BLOCK] = data[shuffled:shuffled+_BLOCK]
+        else:
+            result[shuffled:shuffled+_BLOCK] = data[ordered:ordered+_BLOCK]
+    return result
+
+
+def _load_template():
+    with open(path.join(_root_path, "template_pokemon.epsd"), "rb") as f:
+        data = f.read()
+    pv, = struct.unpack_from(">I", data, _PV)
+    return bytes(_shuffle(data, pv, unshuffle=True)), pv
+
+_template, _template_pv = _load_template()
+
+
+def _personality(gender, nature, shiny):
+    # same as setting gender, then nature through adapter.Pokemon
+    pv = _template_pv
+    pv = pv & 0xffffff00 if gender == 1 else pv | 0xff
+    low = pv & 0xff
+    pv = (5376 * (nature % 25 + (275 - low)) + low) & 0xffffffff
+    xor = (pv >> 16) ^ (pv & 0xffff)
+    return pv, xor if shiny else ~xor & 0xffff
+
+
+def encode_name(name):
+    if len(name) > _NAME_LENGTH:
+        raise ValueError("Name too long: %s" % name)
+    try:
+        codes = [_CHARS[c] for c in name]
+    except KeyError:
+        raise ValueError("Invalid characters in name: %s" % name)
+    return struct.pack(">%dH" % (len(codes) + 1), *codes, 0xffff)\
+        .ljust(2 * _NAME_LENGTH + 2, b"\0")
+
+
+def decode_name(data):
+    '''Turns an encoded name, e.g. from encode_name(), back into a string.'''
+    name = []
+    for i in range(0, len(data) - 1, 2):
+        code, = struct.unpack_from(">H", data, i)
+        if code == 0xffff:
+            break
+        name.append(_CODES.get(code, "?"))
+    return "".join(name)
+
+
+def _encode_into(buf, offset, data):
+    species = data["species"]["id"]
+    if species not in range(1, 1+493):
+        raise ValueError("Invalid species id %d" % (species, ))
+    gender = {"m": 0, "f": 1}.get(data["gender"], 2)
+    pv, secret_id = _personality(gender, data["nature"]["id"], data["shiny"])
+    block = bytearray(_template)
+    struct.pack_into(">I", block, _PV, pv)
+    struct.pack_into(">HHHHI", block, _SPECIES, species, data["item"]["id"],
+                     0, secret_id, get_experience_points(species, data["level"]))
+    block[_FRIENDSHIP] = data["happiness"]
+    block[_ABILITY] = data["ability"]["id"]
+    block[_EVS:_EVS+6] = bytes(data["evs"][stat] for stat in _STATS)
+    moves = data["moves"]
+    struct.pack_into(">4H", block, _MOVES,
+                     *(move["id"] for move in moves), *[0] * (4 - len(moves)))
+    for i, move in enumerate(moves):
+        block[_PP+i] = move.get("pp", 5)
+        block[_PP_UPS+i] = move.get("pp_ups", 0)
+    ivs = struct.unpack_from(">I", block, _IVS)[0] & 3
+    for i, stat in enumerate(_STATS):
+        ivs |= (data["ivs"][stat] & 31) << (27 - 5 * i)
+    struct.pack_into(">I", block, _IVS, ivs)
+    flags = block[_FLAGS] & ~(_FEMALE | _GENDERLESS | _FORM) | _FATEFUL
+    flags |= (0, _FEMALE, _GENDERLESS)[gender]
+    block[_FLAGS] = flags | (data["form"] & _FORM)
+    block[_NAME:_NAME+2*_NAME_LENGTH+2] = encode_name(data["ingamename"])
+    block[_BALL] = data["ball"]["id"]
+    checksum = sum(struct.unpack_from(">64H", block, 8)) & 0xffff
+    struct.pack_into(">H", block, _CHECKSUM, checksum)
+    buf[offset:offset+SIZE] = _shuffle(block, pv)
+
+
+def encode(data):
+    '''Returns the 0x88 bytes of a pokeset.'''
+    buf = bytearray(SIZE)
+    _encode_into(buf, 0, data)
+    return bytes(buf)
+
+
+def encode_many(pokesets):
+    '''Returns the blobs of all <pokesets> concatenated, 0x88 bytes each.'''
+    buf = bytearray(SIZE * len(pokesets))
+    for i, data in enumerate(pokesets):
+        _encode_into(buf, i * SIZE, data)
+    return bytes(buf)
+
+
+def decode(blob):
+    '''
+    Returns what encode() needs to produce <blob> again, in the shape of a
+    pokeset: species, item, ability, nature and ball as {"id": ...}.
+    '''
+    pv, = struct.unpack_from(">I", blob, _PV)
+    block = _shuffle(blob, pv, unshuffle=True)
+    species, item, ot_id, secret_id, experience = \
+        struct.unpack_from(">HHHHI", block, _SPECIES)
+    ivs, = struct.unpack_from(">I", block, _IVS)
+    flags = block[_FLAGS]
+    moves = struct.unpack_from(">4H", block, _MOVES)
+    return {
+        "species": {"id": species},
+        "item": {"id": item},
+        "level": get_level(species, experience),
+        "ingamename": decode_name(block[_NAME:_NAME+2*_NAME_LENGTH]),
+        "ability": {"id": block[_ABILITY]},
+        "shiny": ot_id ^ secret_id ^ (pv >> 16) ^ (pv & 0xffff) < 8,
+        "gender": "f" if flags & _FEMALE else None if flags & _GENDERLESS
+                  else "m",
+        "nature": {"id": pv % 25},
+        "form": flags & _FORM,
+        "happiness": block[_FRIENDSHIP],
+        "ball": {"id": block[_BALL]},
+        "ivs": {stat: ivs >> (27 - 5 * i) & 31
+                for i, stat in enumerate(_STATS)},
+        "evs": {stat: block[_EVS+i] for i, stat in enumerate(_STATS)},
+        "moves": [{"id": move, "pp": block[_PP+i], "pp_ups": block[_PP_UPS+i]}
+                  for i, move in enumerate(moves) if move],
+    }
+
+
+def decode_many(data):
+    '''Decodes concatenated blobs, see encode_many().'''
+    return [decode(data[i:i+SIZE]) for i in range(0, len(data), SIZE)]
+
+
+def check_parity(pokesets):
+    '''
+    Encodes all <pokesets> with both this codec and libeps.
+    Returns a list of (ingamename, [differing offsets]) for every mismatch.
+    '''
+    try:
+        from factory import get_pokemon_bytes
+    except ImportError:
+        from .factory import get_pokemon_bytes
+    mismatches = []
+    for data in pokesets:
+        ours = encode(data)
+        theirs = get_pokemon_bytes(data)
+        if ours != theirs:
+            mismatches.append((data["ingamename"],
+                               [i for i in range(SIZE) if ours[i] != theirs[i]]))
+    return mismatches
+
+
+if __name__ == "__main__":
+    import sys
+    import json
+    with open(sys.argv[1], encoding="utf-8") as f:
+        pokesets = json.load(f)
+    mismatches = check_parity(pokesets)
+    for name, offsets in mismatches:
+        print("%s differs at %s" % (name, ", ".join("0x%02x" % o for o in offsets)))
+    print("%d of %d pokesets match" % (len(pokesets) - len(mismatches), len(pokesets)))
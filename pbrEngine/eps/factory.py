@@ -1,14 +1,49 @@
 
 from os import path
+from threading import Lock
+from collections import OrderedDict
 try:
-    from adapter import Pokemon
+    import codec
 except ImportError:
-    from .adapter import Pokemon
+    from . import codec
 
 _root_path = path.abspath(path.dirname(__file__))
 
+# the template gets read once, pooled pokemon get reset to it from memory.
+# created on first use, which loads libeps. See _get_pool.
+_pool = None
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        try:
+            from adapter import PokemonPool
+        except ImportError:
+            from .adapter import PokemonPool
+        _pool = PokemonPool(path.join(_root_path, "template_pokemon.epsd"))
+    return _pool
+
+
 def get_pokemon_from_data(data):
-    p = Pokemon(path.join(_root_path, "template_pokemon.epsd"))
+    '''
+    Returns a new Pokemon object for the pokeset <data>.
+    It should be close()d when done, see also get_pokemon_bytes.
+    '''
+    try:
+        from adapter import Pokemon
+    except ImportError:
+        from .adapter import Pokemon
+    return _fill_pokemon(Pokemon(_get_pool().template), data)
+
+
+def get_pokemon_bytes(data):
+    '''Returns get_pokemon_from_data(data).to_bytes(), using a pooled Pokemon.'''
+    with _get_pool().pokemon() as p:
+        return _fill_pokemon(p, data).to_bytes()
+
+
+def _fill_pokemon(p, data):
     p.species_number = data["species"]["id"]
     p.item = data["item"]["id"]
     p.level = data["level"]
@@ -44,3 +79,82 @@ def get_pokemon_from_data(data):
     p.fix_checksum()
     return p
 
+
+
+# the encoded blobs of the most recently used pokesets
+_blob_cache = OrderedDict()
+_blob_cache_size = 512
+_blob_cache_stats = {"hits": 0, "misses": 0}
+# the engines encode from threadpool workers, see PBREngine.new()
+_blob_cache_lock = Lock()
+
+
+def _blob_key(data):
+    '''
+    Canonical key of everything in a pokeset that ends up in its bytes,
+    see get_pokemon_from_data. Other fields like the display name don't
+    split the cache.
+    '''
+    return (data["species"]["id"], data["item"]["id"], data["level"],
+            data["ingamename"], data["ability"]["id"], bool(data["shiny"]),
+            data["gender"], data["nature"]["id"], data["form"],
+            data["happiness"], data["ball"]["id"],
+            tuple(data["ivs"][stat] for stat in ("hp", "atk", "def", "spe", "spA", "spD")),
+            tuple(data["evs"][stat] for stat in ("hp", "atk", "def", "spe", "spA", "spD")),
+            tuple((move["id"], move.get("pp", 5), move.get("pp_ups", 0))
+                  for move in data["moves"]))
+
+
+def get_pokemon_blob(data):
+    '''
+    Returns the 0x88 bytes of get_pokemon_from_data(data).to_bytes(),
+    from a bounded LRU cache if the same pokeset was encoded before.
+    Cache misses get encoded by codec, which skips libeps entirely.
+    Safe to call from several threads at once, see PBREngine.new().
+    '''
+    key = _blob_key(data)
+    with _blob_cache_lock:
+        blob = _blob_cache.get(key)
+        if blob is not None:
+            _blob_cache.move_to_end(key)
+            _blob_cache_stats["hits"] += 1
+            return blob
+        _blob_cache_stats["misses"] += 1
+    # outside the lock, so other threads aren't held up by the encoding
+    blob = codec.encode(data)
+    with _blob_cache_lock:
+        _blob_cache[key] = blob
+        _trim_blob_cache()
+    return blob
+
+
+def _trim_blob_cache():
+    # must hold _blob_cache_lock
+    while len(_blob_cache) > _blob_cache_size:
+        _blob_cache.popitem(last=False)
+
+
+def blob_cache_info():
+    '''Returns a dict with the cache's hits, misses, size and maxsize.'''
+    with _blob_cache_lock:
+        return dict(_blob_cache_stats, size=len(_blob_cache),
+                    maxsize=_blob_cache_size)
+
+
+def set_blob_cache_size(size):
+    global _blob_cache_size
+    with _blob_cache_lock:
+        _blob_cache_size = size
+        _trim_blob_cache()
+
+
+def invalidate_blob_cache(data=None):
+    '''
+    Drops the cached blob of the pokeset <data>, or all of them.
+    Needed if the template or the encoding changes while running.
+    '''
+    with _blob_cache_lock:
+        if data is None:
+            _blob_cache.clear()
+        else:
+            _blob_cache.pop(_blob_key(data), None)
@@ -13,7 +13,7 @@ from .memorymap.values import GuiStateMenu, GuiStateBP, GuiStateRules,\
                               GuiStateBpSelection
 from .memorymap.values import GuiStateOrderSelection, GuiStateMatch,\
                               StatePopupBox
-from .util import bytesToString
+from .util import TextRecognizer
 
 
 class Distinguisher(object):
@@ -43,7 +43,7 @@ class Distinguisher(object):
             self._callback(PbrGuis.MATCH_POPUP)
 
     def distinguishStart(self, data):
-        self._callback(_map_start.get(bytesToString(data)))
+        self._callback(_map_start.get(data))
 
 # Main Menu
 _map_menu = {
@@ -107,3 +107,5 @@ _map_start = {
     "Colosseum Mode"             : PbrGuis.START_MODE,
     "Continue"                   : PbrGuis.START_SAVEFILE, # doesn't work, but relying on unstucker anyway
 }
+# compares the raw text in memory, see util.TextRecognizer
+_map_start = TextRecognizer(_map_start)
@@ -26,8 +26,8 @@ class Locations(Enum):
     WHICH_PLAYER     = Loc(0x478477, 1)
     PNAME_BLUE       = Loc(0x47850c, 20)
     PNAME_RED        = Loc(0x478f7c, 20)
-    PP_BLUE          = Loc(0x478534, 4)  # TODO don't use yet, the addresses change, find the pattern
-    PP_RED           = Loc(0x478f64, 4)  # ^
+    PP_BLUE          = Loc(0x478534, 4)  # start of BATTLE_BLUE, one byte per move
+    PP_RED           = Loc(0x478f84, 4)  # start of BATTLE_RED
     CURSOR_POS       = Loc(0x63eb9a, 2)
     ATTACK_TEAM_TEXT = Loc(0x47a579, 1)
     GUI_STATE_MATCH  = Loc(0x478499, 1)
@@ -69,5 +69,9 @@ class Locations(Enum):
     BLUR2            = Loc(0x641e90, 4)
     HP_BLUE          = Loc(0x478552, 2)
     HP_RED           = Loc(0x478fa2, 2)
+    # the active pokemon of each side, 0xa50 bytes apart.
+    # see BattleStructOffsets
+    BATTLE_BLUE      = Loc(0x478534, 0x20)
+    BATTLE_RED       = Loc(0x478f84, 0x20)
 
     POINTER_BP_STRUCT = Loc(0x918F4FFC, 4)
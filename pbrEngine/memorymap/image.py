@@ -0,0 +1,136 @@
+'''
+Created on 18.10.2026
+
+In-process stand-in for a DolphinConnection, backed by a plain memory image.
+'''
+
+from collections import defaultdict
+
+
+def _overlaps(addr1, length1, addr2, length2):
+    return addr1 < addr2 + length2 and addr2 < addr1 + length1
+
+
+class MemoryImage(object):
+    '''
+    Offers the parts of the DolphinConnection interface the engine uses,
+    without any Dolphin involved. Memory is a sparse image, unset bytes are 0.
+    Every change to the image is reported to all overlapping subscriptions,
+    no matter how they are laid out, but only if their data actually changed.
+    Writes are counted in <writes>, all other calls like button presses
+    in <calls> by name.
+    Base for replaying recordings and for simulating a game.
+    '''
+    def __init__(self):
+        self._memory = {}  # addr -> byte
+        # (owner, addr) -> [size, callback, multi, last]
+        self._subscriptions = {}
+        self._connectCallbacks = []
+        self._disconnectCallbacks = []
+        self.writes = 0
+        self.calls = defaultdict(int)
+
+    def get(self, addr, size):
+        return bytes(self._memory.get(a, 0) for a in range(addr, addr+size))
+
+    def set(self, addr, data):
+        '''Changes the image and notifies the affected subscriptions.'''
+        for i, byte in enumerate(data):
+            self._memory[addr+i] = byte
+        self._notify(addr, len(data))
+
+    def getValue(self, loc):
+        return int.from_bytes(self.get(loc.addr, loc.length), "big")
+
+    def setValue(self, loc, val):
+        self.set(loc.addr, val.to_bytes(loc.length, "big"))
+
+    def _notify(self, addr, length):
+        for (_, subAddr), sub in list(self._subscriptions.items()):
+            size, callback, multi, last = sub
+            if not _overlaps(addr, length, subAddr, size):
+                continue
+            data = self.get(subAddr, size)
+            if data == last:
+                continue
+            sub[3] = data
+            callback(data if multi else int.from_bytes(data, "big"))
+
+    def onConnect(self, callback):
+        self._connectCallbacks.append(callback)
+
+    def onDisconnect(self, callback):
+        self._disconnectCallbacks.append(callback)
+
+    def connect(self):
+        for callback in self._connectCallbacks:
+            callback(self)
+
+    def disconnect(self):
+        pass
+
+    # <owner> tells apart several clients subscribed to the same address,
+    # see simulation.DolphinWatchServer. Each owner has at most one
+    # subscription per address, like a single DolphinConnection.
+
+    def _subscribe(self, bits, addr, callback, owner=None):
+        self._subscriptions[(owner, addr)] = [bits // 8, callback, False, None]
+
+    def _subscribeMulti(self, size, addr, callback, owner=None):
+        self._subscriptions[(owner, addr)] = [size, callback, True, None]
+
+    def unSubscribe(self, addr, owner=None):
+        self._subscriptions.pop((owner, addr), None)
+
+    def unSubscribeMulti(self, addr, owner=None):
+        self._subscriptions.pop((owner, addr), None)
+
+    def _read(self, addr, size):
+        return self.get(addr, size)
+
+    def read32(self, addr, callback):
+        callback(int.from_bytes(self._read(addr, 4), "big"))
+
+    def readMulti(self, addr, size, callback):
+        callback(self._read(addr, size))
+
+    def _write(self, addr, data):
+        self.writes += 1
+        self.set(addr, data)
+
+    def write8(self, addr, val):
+        self._write(addr, val.to_bytes(1, "big"))
+
+    def write16(self, addr, val):
+        self._write(addr, val.to_bytes(2, "big"))
+
+    def write32(self, addr, val):
+        self._write(addr, (val & 0xffffffff).to_bytes(4, "big"))
+
+    def writeMulti(self, addr, data):
+        self._write(addr, bytes(data))
+
+    def _count(self, name):
+        self.calls[name] += 1
+
+    def wiiButton(self, wiimote, buttons):
+        self._count("wiiButton")
+
+    def pause(self):
+        self._count("pause")
+
+    def resume(self):
+        self._count("resume")
+
+    def speed(self, speed):
+        self._count("speed")
+
+    def volume(self, volume):
+        self._count("volume")
+
+    def save(self, filename):
+        self._count("save")
+
+    def load(self, filename):
+        self._count("load")
+        return True
@@ -85,6 +85,13 @@ class BPStructOffsets(IntEnum):
     PKMN_RED  = 0x5B94C
 
 
+class BattleStructOffsets(IntEnum):
+    # within Locations.BATTLE_BLUE and BATTLE_RED
+    PP     = 0x00  # 4 bytes, one per move
+    STATUS = 0x1b  # same as STATUS_BLUE/STATUS_RED
+    HP     = 0x1e  # 2 bytes, same as HP_BLUE/HP_RED
+
+
 DefaultValues = {
     "GUI_POS_X": intToFloatRepr(0xbe830304),
     "GUI_POS_Y": intToFloatRepr(0x41700000),
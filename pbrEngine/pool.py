@@ -0,0 +1,248 @@
+'''
+Created on 18.10.2026
+
+Runs many engines, each driving its own Dolphin, from one process.
+'''
+
+import os
+import logging
+import itertools
+import gevent
+from functools import partial
+from gevent.event import AsyncResult
+from gevent.queue import Queue
+
+from .engine import PBREngine
+from .states import PbrStates
+from .util import EventHook
+
+logger = logging.getLogger("pbrEngine")
+
+
+class InstanceCrashed(Exception):
+    pass
+
+
+class Instance(object):
+    '''
+    One engine of an EnginePool and its bookkeeping.
+    <healthy> is False while the instance is out of rotation.
+    '''
+    def __init__(self, pbr, port):
+        self.pbr = pbr
+        self.port = port
+        self.healthy = True
+        self.crashes = 0
+        self.matches = 0
+        self.spec = None  # kwargs of the match currently being played
+        self.result = None  # AsyncResult of that match
+        self.tries = 0  # how often that match crashed before
+        self.number = 0  # submission order of that match
+        self.preparing = None  # spec the engine got last, see ready
+        self._lastFrame = 0
+        self._stalled = 0
+
+    @property
+    def ready(self):
+        '''
+        Whether a prepared match of this instance may be started:
+        It must be in rotation and prepared the match it is assigned,
+        not one it got taken away after a crash.
+        '''
+        return self.healthy and self.spec is not None and \
+            self.preparing is self.spec
+
+    def __repr__(self):
+        return "Instance(port=%d)" % self.port
+
+
+class EnginePool(object):
+    '''
+    Manages a PBREngine for each of the given ports, all on <host>.
+    Matches get submitted with submit() and are played by whichever instance
+    reaches WAITING_FOR_NEW first. Each one is started as soon as its
+    preparation is done.
+
+    Instances whose framecount doesn't advance for <stall_limit> seconds
+    while they should be busy are considered crashed. They are taken out of
+    rotation, their match gets queued again and on_crash is fired.
+    Call restore() once that Dolphin is up again.
+    <dolphin_factory> can be used to create the connections, it gets called
+    with the port. E.g. lambda port: SimulatedDolphin() for load testing.
+
+    With <hot_standby>, only one match is played at a time. The other
+    instances prepare the next matches up to WAITING_FOR_START in the
+    meantime. As soon as the current match ended, the prepared match that
+    was submitted first gets started. on_live tells which instance to show.
+
+        pool = EnginePool(actionCallback, [6000, 6001, 6002])
+        pool.connect()
+        result = pool.submit(Colosseums.GATEWAY, team1, team2)
+        result.get()  # {'winner': 'blue', 'port': 6001}
+    '''
+    def __init__(self, action_callback, ports, host="localhost",
+                 savefile_dir="pbr_savefiles", stall_limit=4, max_retries=2,
+                 dolphin_factory=None, hot_standby=False, **engine_kwargs):
+        self.stall_limit = stall_limit
+        self.max_retries = max_retries
+        self.hot_standby = hot_standby
+        self.live = None  # instance playing with hot_standby
+        self._queue = Queue()  # (number, spec, result, tries)
+        self._idle = Queue()
+        self._standby = []  # prepared instances waiting to go live
+        self._sequence = itertools.count()
+        self.instances = []
+        for port in ports:
+            # each Dolphin needs its own savestates
+            dolphin = dolphin_factory(port) if dolphin_factory else None
+            pbr = PBREngine(action_callback, host, port,
+                            savefile_dir=os.path.join(savefile_dir, str(port)),
+                            dolphin=dolphin, **engine_kwargs)
+            instance = Instance(pbr, port)
+            pbr.on_state += partial(self._stateChanged, instance)
+            pbr.on_win += partial(self._matchOver, instance)
+            self.instances.append(instance)
+        '''
+        Event of an instance being taken out of rotation,
+        because it seems to have crashed.
+        arg0: <instance> the Instance, call restore() with it when fixed
+        '''
+        self.on_crash = EventHook(instance=Instance)
+        '''
+        Event of an instance starting its match with hot_standby.
+        arg0: <instance> the Instance now playing
+        '''
+        self.on_live = EventHook(instance=Instance)
+
+    def connect(self):
+        for instance in self.instances:
+            instance.pbr.connect()
+            gevent.spawn(self._watch, instance)
+        gevent.spawn(self._dispatch)
+
+    def submit(self, colosseum, pkmn_blue, pkmn_red, **kwargs):
+        '''
+        Queues a match. Takes the same arguments as PBREngine.new().
+        Returns an AsyncResult, which will be set to a dict
+        {"winner": winner, "port": port} once the match is over.
+        Fails with InstanceCrashed if the match crashed too often.
+        '''
+        spec = dict(kwargs, colosseum=colosseum, pkmn_blue=pkmn_blue,
+                    pkmn_red=pkmn_red)
+        result = AsyncResult()
+        self._queue.put((next(self._sequence), spec, result, 0))
+        return result
+
+    @property
+    def pending(self):
+        '''Number of matches waiting for an instance.'''
+        return self._queue.qsize()
+
+    def restore(self, instance):
+        '''Puts a crashed instance back into rotation.'''
+        instance.healthy = True
+        instance._stalled = 0
+        instance._lastFrame = instance.pbr.timer.frame
+        if instance.pbr.state == PbrStates.WAITING_FOR_NEW:
+            self._idle.put(instance)
+
+    def _dispatch(self):
+        while True:
+            number, spec, result, tries = self._queue.get()
+            instance = self._idle.get()
+            while not instance.healthy or instance.spec:
+                # went down or got busy while waiting in the queue
+                instance = self._idle.get()
+            instance.spec = spec
+            instance.result = result
+            instance.tries = tries
+            instance.number = number
+            gevent.spawn(self._new, instance, spec)
+
+    def _new(self, instance, spec):
+        instance.preparing = spec
+        instance.pbr.new(**spec)
+
+    def _stateChanged(self, instance, state):
+        if state == PbrStates.WAITING_FOR_NEW:
+            if instance.spec:
+                # never got to play it, e.g. got reset by a crash
+                return
+            if instance.healthy:
+                self._idle.put(instance)
+        elif state == PbrStates.WAITING_FOR_START:
+            self._prepared(instance)
+        elif state == PbrStates.MATCH_ENDED and instance is self.live:
+            self.live = None
+            self._promote()
+
+    def _prepared(self, instance):
+        if not instance.ready:
+            logger.warning("%r prepared a match it isn't assigned, "
+                           "not starting it", instance)
+            return
+        if not self.hot_standby:
+            instance.pbr.start()
+            return
+        self._standby.append(instance)
+        self._promote()
+
+    def _promote(self):
+        # start the next prepared match if nothing is playing right now
+        self._standby = [i for i in self._standby if i.ready]
+        if self.live or not self._standby:
+            return
+        instance = min(self._standby, key=lambda i: i.number)
+        self._standby.remove(instance)
+        self.live = instance
+        self.on_live(instance=instance)
+        instance.pbr.start()
+
+    def _matchOver(self, instance, winner):
+        result = instance.result
+        instance.spec = None
+        instance.result = None
+        instance.matches += 1
+        if result:
+            result.set({"winner": winner, "port": instance.port})
+
+    def _watch(self, instance):
+        '''
+        Shall be spawned as a Greenlet, one per instance.
+        Checks every second if the game is still running.
+        '''
+        while True:
+            gevent.sleep(1)
+            if not instance.healthy:
+                continue
+            now = instance.pbr.timer.frame
+            if now == instance._lastFrame and instance.pbr.state not in \
+                    (PbrStates.WAITING_FOR_NEW, PbrStates.WAITING_FOR_START):
+                instance._stalled += 1
+            else:
+                instance._lastFrame = now
+                instance._stalled = 0
+            if instance._stalled >= self.stall_limit:
+                self._crashed(instance)
+
+    def _crashed(self, instance):
+        logger.error("%r seems to have crashed, taking it out of rotation",
+                     instance)
+        instance.healthy = False
+        instance.crashes += 1
+        if instance in self._standby:
+            self._standby.remove(instance)
+        if instance.spec:
+            spec, result, tries = instance.spec, instance.result, instance.tries
+            instance.spec = None
+            instance.result = None
+            instance.preparing = None
+            if tries < self.max_retries:
+                self._queue.put((instance.number, spec, result, tries + 1))
+            else:
+                result.set_exception(InstanceCrashed(
+                    "Match crashed %d times, last on %r" % (tries + 1, instance)))
+        self.on_crash(instance=instance)
+        if instance is self.live:
+            self.live = None
+            self._promote()
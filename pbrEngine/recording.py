@@ -0,0 +1,199 @@
+'''
+Created on 18.10.2026
+
+Recording of the traffic between the engine and dolphinWatch,
+and replaying such recordings without a running Dolphin.
+'''
+
+import json
+import struct
+import logging
+import gevent
+from collections import defaultdict, deque
+
+from .memorymap.addresses import Locations
+from .memorymap.image import MemoryImage
+
+logger = logging.getLogger("pbrEngine")
+
+_MAGIC = b"PBRREC\x00\x01"
+# type, frame, address, payload length
+_HEADER = struct.Struct(">BIII")
+
+# record types
+DATA = 1   # subscription callback, payload: raw bytes
+READ = 2   # answer to a read, payload: raw bytes
+WRITE = 3  # outgoing write, payload: raw bytes
+CALL = 4   # any other outgoing call, payload: json [name, args]
+
+_FRAMECOUNT = Locations.FRAMECOUNT.value
+
+
+def readRecords(filename):
+    '''
+    Generator yielding all records of a recording
+    as (type, frame, addr, payload) tuples.
+    '''
+    with open(filename, "rb") as f:
+        if f.read(len(_MAGIC)) != _MAGIC:
+            raise ValueError("%s is not a pbrEngine recording" % filename)
+        while True:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                return
+            type, frame, addr, length = _HEADER.unpack(header)
+            yield type, frame, addr, f.read(length)
+
+
+class Recorder(object):
+    '''
+    Wraps a DolphinConnection and writes everything passing through
+    to a binary log: all subscription callbacks and read results with their
+    raw bytes, all writes, and all other outgoing calls like button presses,
+    pause/resume and save/load. Every record is tagged with the latest
+    known framecount.
+    Can be handed to PBREngine(dolphin=...). Use Replayer to play it back.
+    '''
+    def __init__(self, dolphin, filename):
+        self._dolphin = dolphin
+        self._file = open(filename, "wb")
+        self._file.write(_MAGIC)
+        self.frame = 0
+        self.records = 0
+
+    def __getattr__(self, name):
+        return getattr(self._dolphin, name)
+
+    def _record(self, type, addr, payload):
+        payload = bytes(payload)
+        self._file.write(_HEADER.pack(type, self.frame, addr, len(payload)))
+        self._file.write(payload)
+        self.records += 1
+
+    def _seen(self, type, addr, data):
+        if addr <= _FRAMECOUNT.addr and \
+                _FRAMECOUNT.addr + _FRAMECOUNT.length <= addr + len(data):
+            offset = _FRAMECOUNT.addr - addr
+            self.frame = int.from_bytes(data[offset:offset+_FRAMECOUNT.length],
+                                        "big")
+        self._record(type, addr, data)
+
+    def _call(self, name, *args):
+        self._record(CALL, 0, json.dumps([name, args]).encode())
+        return getattr(self._dolphin, name)(*args)
+
+    def close(self):
+        self._file.close()
+
+    def _subscribe(self, bits, addr, callback):
+        def recorded(val):
+            self._seen(DATA, addr, val.to_bytes(bits // 8, "big"))
+            callback(val)
+        self._dolphin._subscribe(bits, addr, recorded)
+
+    def _subscribeMulti(self, size, addr, callback):
+        def recorded(data):
+            self._seen(DATA, addr, bytes(data))
+            callback(data)
+        self._dolphin._subscribeMulti(size, addr, recorded)
+
+    def read32(self, addr, callback):
+        def recorded(val):
+            self._seen(READ, addr, val.to_bytes(4, "big"))
+            callback(val)
+        self._dolphin.read32(addr, recorded)
+
+    def readMulti(self, addr, size, callback):
+        def recorded(data):
+            self._seen(READ, addr, bytes(data))
+            callback(data)
+        self._dolphin.readMulti(addr, size, recorded)
+
+    def write8(self, addr, val):
+        self._record(WRITE, addr, val.to_bytes(1, "big"))
+        self._dolphin.write8(addr, val)
+
+    def write16(self, addr, val):
+        self._record(WRITE, addr, val.to_bytes(2, "big"))
+        self._dolphin.write16(addr, val)
+
+    def write32(self, addr, val):
+        self._record(WRITE, addr, (val & 0xffffffff).to_bytes(4, "big"))
+        self._dolphin.write32(addr, val)
+
+    def writeMulti(self, addr, data):
+        self._record(WRITE, addr, data)
+        self._dolphin.writeMulti(addr, data)
+
+    def wiiButton(self, wiimote, buttons):
+        self._call("wiiButton", wiimote, buttons)
+
+    def pause(self):
+        self._call("pause")
+
+    def resume(self):
+        self._call("resume")
+
+    def speed(self, speed):
+        self._call("speed", speed)
+
+    def volume(self, volume):
+        self._call("volume", volume)
+
+    def save(self, filename):
+        self._call("save", filename)
+
+    def load(self, filename):
+        return self._call("load", filename)
+
+    def disconnect(self):
+        self._dolphin.disconnect()
+        self._file.flush()
+
+
+class Replayer(MemoryImage):
+    '''
+    Stands in for a DolphinConnection and plays a recording made with
+    Recorder back into an engine, as fast as possible:
+
+        replayer = Replayer("match.rec")
+        pbr = PBREngine(actionCallback, dolphin=replayer)
+        pbr.connect()
+        replayer.run()
+
+    The memory is kept as an image built from the recorded data.
+    Recorded data gets delivered to all current subscriptions overlapping it,
+    so the engine doesn't need to subscribe exactly like the recorded one.
+    Reads are answered with the recorded results for the same location
+    in order, or from the image if there are none left.
+    The engine's writes and calls are counted, see MemoryImage.
+    '''
+    def __init__(self, filename):
+        super().__init__()
+        self._filename = filename
+        self._reads = defaultdict(deque)  # (addr, size) -> recorded results
+        self.frame = 0
+        self.records = 0
+        for type, _, addr, payload in readRecords(filename):
+            if type == READ:
+                self._reads[(addr, len(payload))].append(payload)
+
+    def run(self):
+        '''
+        Feeds the whole recording to the subscribers.
+        Lets the engine's greenlets run in between each record.
+        Returns the number of records processed.
+        '''
+        for type, frame, addr, payload in readRecords(self._filename):
+            self.frame = frame
+            self.records += 1
+            if type == DATA:
+                self.set(addr, payload)
+            gevent.sleep(0)
+        return self.records
+
+    def _read(self, addr, size):
+        recorded = self._reads.get((addr, size))
+        if recorded:
+            self.set(addr, recorded.popleft())
+        return self.get(addr, size)
@@ -0,0 +1,176 @@
+'''
+Created on 18.10.2026
+
+Keeps track of the savestates the engine made, with content hashes.
+'''
+
+import os
+import json
+import time
+import hashlib
+import logging
+import gevent
+
+logger = logging.getLogger("pbrEngine")
+
+_INDEX = "index.json"
+
+
+def _hashFile(filename):
+    digest = hashlib.sha1()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _keyName(key):
+    # covers bools and IntEnums like the avatars too
+    return "-".join(str(int(part)) if isinstance(part, int) else str(part)
+                    for part in key)
+
+
+class SavestateLibrary(object):
+    '''
+    Savestates stored in <directory>, each under a key, which is a tuple
+    describing what the game looks like in it, e.g. ("base", True).
+    The content hash of each savestate is stored once Dolphin finished
+    writing it, and checked again before it gets loaded, so corrupted files
+    are detected before Dolphin tries to load them.
+    Unpinned savestates get evicted least recently used first as soon as all
+    savestates together take up more than <budget> bytes.
+    The index is kept in <directory>/index.json.
+    '''
+    def __init__(self, directory, budget=4 << 30, settle_timeout=30):
+        self.directory = os.path.abspath(directory)
+        self.budget = budget
+        self.settle_timeout = settle_timeout
+        os.makedirs(self.directory, exist_ok=True)
+        self._entries = {}
+        try:
+            with open(os.path.join(self.directory, _INDEX)) as f:
+                for entry in json.load(f):
+                    if entry["sha1"]:  # otherwise never finished writing
+                        self._entries[tuple(entry["key"])] = entry
+        except (OSError, ValueError):
+            pass
+
+    def path(self, key):
+        '''Returns the filename a savestate for <key> is or would be saved at.'''
+        entry = self._entries.get(tuple(key))
+        if entry:
+            return entry["path"]
+        return os.path.join(self.directory, _keyName(key) + ".state")
+
+    def __contains__(self, key):
+        return tuple(key) in self._entries
+
+    def keys(self, *prefix):
+        '''Returns the keys of all hashed savestates starting with <prefix>.'''
+        return [key for key, entry in self._entries.items()
+                if entry["sha1"] and key[:len(prefix)] == prefix]
+
+    def hashed(self, key):
+        '''Returns whether a savestate for <key> exists and got hashed.'''
+        entry = self._entries.get(tuple(key))
+        return bool(entry and entry["sha1"])
+
+    def add(self, key, path=None, pinned=False):
+        '''
+        Registers a savestate that was just saved. Its hash gets computed in
+        the background as soon as the file stopped growing. Until then,
+        find() doesn't consider it. If no file shows up within
+        <settle_timeout> seconds, the entry is dropped again.
+        Pinned savestates never get evicted.
+        '''
+        key = tuple(key)
+        self._entries[key] = {"key": list(key), "path": path or self.path(key),
+                              "pinned": pinned, "sha1": None, "size": 0,
+                              "used": time.time()}
+        gevent.spawn(self._hashWhenWritten, key)
+
+    def remove(self, key, delete=True):
+        entry = self._entries.pop(tuple(key), None)
+        if entry and delete and not entry["pinned"]:
+            try:
+                os.remove(entry["path"])
+            except OSError:
+                pass
+        self._saveIndex()
+
+    def verify(self, key):
+        '''
+        Hashes the savestate again and compares it with the stored hash.
+        Removes the entry if it doesn't match or the file is gone.
+        Hashing is done in the threadpool, so other greenlets keep running.
+        '''
+        entry = self._entries.get(tuple(key))
+        if not entry or not entry["sha1"]:
+            return False
+        try:
+            digest = gevent.get_hub().threadpool.apply(_hashFile,
+                                                       (entry["path"],))
+        except OSError:
+            digest = None
+        if digest != entry["sha1"]:
+            logger.warning("Savestate %s is corrupted or gone, dropping it",
+                           entry["path"])
+            self.remove(key)
+            return False
+        return True
+
+    def find(self, keys):
+        '''
+        Returns the first of <keys> with a savestate that passes verify(),
+        or None. Marks it as recently used.
+        '''
+        for key in keys:
+            if self.verify(key):
+                self._entries[tuple(key)]["used"] = time.time()
+                self._saveIndex()
+                return tuple(key)
+        return None
+
+    def _hashWhenWritten(self, key):
+        entry = self._entries[key]
+        size = -1
+        deadline = time.time() + self.settle_timeout
+        while True:
+            gevent.sleep(0.5)
+            if self._entries.get(key) is not entry:
+                return  # replaced or removed in the meantime
+            try:
+                newSize = os.path.getsize(entry["path"])
+            except OSError:
+                newSize = -1
+            if newSize > 0 and newSize == size:
+                break
+            size = newSize
+            if time.time() > deadline:
+                logger.warning("Savestate %s never got written", entry["path"])
+                self._entries.pop(key, None)
+                self._saveIndex()
+                return
+        entry["sha1"] = gevent.get_hub().threadpool.apply(_hashFile,
+                                                          (entry["path"],))
+        entry["size"] = size
+        self._evict()
+        self._saveIndex()
+
+    def _evict(self):
+        total = sum(e["size"] for e in self._entries.values())
+        candidates = sorted((e for e in self._entries.values()
+                             if not e["pinned"] and e["sha1"]),
+                            key=lambda e: e["used"])
+        for entry in candidates:
+            if total <= self.budget:
+                break
+            logger.info("Evicting savestate %s", entry["path"])
+            total -= entry["size"]
+            self.remove(entry["key"])
+
+    def _saveIndex(self):
+        filename = os.path.join(self.directory, _INDEX)
+        with open(filename + ".tmp", "w") as f:
+            json.dump(list(self._entries.values()), f, indent=1)
+        os.replace(filename + ".tmp", filename)
@@ -0,0 +1,718 @@
+'''
+Created on 18.10.2026
+
+A simulated PBR for running engines without Dolphin, e.g. for load testing.
+'''
+
+import json
+import heapq
+import random
+import logging
+import itertools
+import gevent
+from functools import partial
+from gevent.server import StreamServer
+
+from .states import PbrGuis
+from .util import encodeString
+from .eps.codec import decode_name
+from .memorymap.image import MemoryImage
+from .memorymap.addresses import Locations
+from .memorymap.values import WiimoteButton, GuiStateMenu, GuiStateBP,\
+    GuiStateRules, GuiStateBpSelection, GuiStateOrderSelection,\
+    GuiStateMatch, GuiTarget, CursorOffsets, CursorPosMenu, CursorPosBP,\
+    BPStructOffsets, BattleStructOffsets
+
+logger = logging.getLogger("pbrEngine")
+
+_BP_STRUCT = 0x91000000  # made up, the engine only follows the pointer
+_BP_PKMN_STRIDE = 0x8c
+# both teams as the engine injects them
+_BP_TEAMS = _BP_STRUCT + BPStructOffsets.PKMN_BLUE
+_BP_TEAMS_LENGTH = BPStructOffsets.PKMN_RED + 6 * _BP_PKMN_STRIDE - \
+    BPStructOffsets.PKMN_BLUE
+_NAME_OFFSET = 0x08  # nickname within a pokemon's data, 11 chars
+
+# what each screen looks like in memory
+_SCREENS = {
+    PbrGuis.MENU_MAIN:           [(Locations.GUI_STATE_MENU, GuiStateMenu.MAIN_MENU)],
+    PbrGuis.MENU_BATTLE_PASS:    [(Locations.GUI_STATE_MENU, GuiStateMenu.BATTLE_PASS)],
+    PbrGuis.MENU_BATTLE_TYPE:    [(Locations.GUI_STATE_MENU, GuiStateMenu.BATTLE_TYPE)],
+    PbrGuis.MENU_BATTLE_PLAYERS: [(Locations.GUI_STATE_MENU, GuiStateMenu.BATTLE_PLAYERS)],
+    PbrGuis.MENU_BATTLE_REMOTES: [(Locations.GUI_STATE_MENU, GuiStateMenu.BATTLE_REMOTES)],
+    PbrGuis.BPS_SELECT:          [(Locations.GUI_STATE_BP, GuiStateBP.BP_SELECTION)],
+    PbrGuis.BPS_SLOTS:           [(Locations.GUI_STATE_BP, GuiStateBP.SLOT_SELECTION)],
+    PbrGuis.BPS_PKMN_GRABBED:    [(Locations.GUI_STATE_BP, GuiStateBP.PKMN_GRABBED)],
+    PbrGuis.BPS_BOXES:           [(Locations.GUI_STATE_BP, GuiStateBP.BOX_SELECTION)],
+    PbrGuis.BPS_PKMN:            [(Locations.GUI_STATE_BP, GuiStateBP.PKMN_SELECTION)],
+    PbrGuis.BPS_PKMN_CONFIRM:    [(Locations.GUI_STATE_BP, GuiStateBP.CONFIRM)],
+    PbrGuis.RULES_STAGE:         [(Locations.GUI_STATE_RULES, GuiStateRules.STAGE_SELECTION)],
+    PbrGuis.RULES_SETTINGS:      [(Locations.GUI_STATE_RULES, GuiStateRules.OVERVIEW)],
+    PbrGuis.RULES_BATTLE_STYLE:  [(Locations.GUI_STATE_RULES, GuiStateRules.BATTLE_STYLE)],
+    PbrGuis.RULES_BPS_CONFIRM:   [(Locations.GUI_STATE_RULES, GuiStateRules.BP_CONFIRM)],
+    PbrGuis.BPSELECT_SELECT:     [(Locations.GUI_STATE_RULES, GuiStateRules.BP_SELECTION),
+                                  (Locations.GUI_STATE_BP_SELECTION, GuiStateBpSelection.BP_SELECTION_CUSTOM)],
+    PbrGuis.BPSELECT_CONFIRM:    [(Locations.GUI_STATE_RULES, GuiStateRules.BP_SELECTION),
+                                  (Locations.GUI_STATE_BP_SELECTION, GuiStateBpSelection.BP_CONFIRM)],
+    PbrGuis.ORDER_SELECT:        [(Locations.GUI_STATE_ORDER, GuiStateOrderSelection.SELECT)],
+    PbrGuis.ORDER_CONFIRM:       [(Locations.GUI_STATE_ORDER, GuiStateOrderSelection.CONFIRM)],
+    PbrGuis.MATCH_FADE_IN:       [(Locations.GUI_STATE_MATCH, GuiStateMatch.FADE_IN)],
+    PbrGuis.MATCH_IDLE:          [(Locations.GUI_STATE_MATCH, GuiStateMatch.IDLE)],
+    PbrGuis.MATCH_MOVE_SELECT:   [(Locations.GUI_STATE_MATCH, GuiStateMatch.MOVES)],
+    PbrGuis.MATCH_PKMN_SELECT:   [(Locations.GUI_STATE_MATCH_PKMN_MENU, GuiStateMatch.PKMN_2),
+                                  (Locations.GUI_STATE_MATCH, GuiStateMatch.PKMN)],
+}
+# not a gui the engine knows, but needed in between
+_RULESET = "ruleset"
+_SCREENS[_RULESET] = [(Locations.GUI_STATE_RULES, GuiStateRules.RULESET)]
+
+# buttons the pokemon selection in a match is done with, by index
+_PKMN_BUTTONS = [WiimoteButton.RIGHT, WiimoteButton.DOWN, WiimoteButton.UP,
+                 WiimoteButton.LEFT, WiimoteButton.TWO, WiimoteButton.ONE]
+
+def _text(string, length):
+    return encodeString(string)[:length].ljust(length, b"\0")
+
+
+class SimulatedDolphin(MemoryImage):
+    '''
+    Stands in for a DolphinConnection running PBR.
+    Runs in the engine's process. To include the socket I/O and the
+    protocol handling, serve it with DolphinWatchServer instead.
+    Models the gui states of the menus the engine navigates through,
+    the battle passes and a very dumb match, in which each pokemon has 100 HP
+    and every move hits for 20-60 damage. The screens change by writing the
+    same memory locations the real game uses, in reaction to button presses,
+    cursor positions and writes.
+    Frames advance in a greenlet by <fps> per second at speed 1.0, so a
+    high <fps> lets the whole setup and match run much faster than realtime.
+    Many instances can run side by side in one process:
+
+        for _ in range(50):
+            pbr = PBREngine(actionCallback, dolphin=SimulatedDolphin(fps=600))
+            pbr.connect()
+
+    Counts played matches in <matches> and screen changes in <transitions>.
+    '''
+    def __init__(self, fps=60, tick=1/60, delay=10, seed=None):
+        super().__init__()
+        self.fps = fps
+        self.tick = tick
+        self.delay = delay  # frames between an input and the screen changing
+        self.frame = 0
+        self.paused = False
+        self.matches = 0
+        self.transitions = 0
+        self._speed = 1.0
+        self._frameBudget = 0.0
+        self._random = random.Random(seed)
+        self._jobs = []
+        self._sequence = itertools.count()
+        self._ticker = None
+        self._screen = None
+        self._busy = False
+        self._passes = [[] for _ in range(8)]
+        self._page = 0
+        self._currentPass = 0
+        self._filling = False
+        self._bpSelections = 0
+        self._ordersLocked = 0
+        self._intro = False
+        self._teams = {}
+        self._hp = {}
+        self._current = {}
+        self._choices = {}
+        self._player = 0
+
+    # connection
+
+    def connect(self):
+        self.setValue(Locations.POINTER_BP_STRUCT.value, _BP_STRUCT)
+        if not self._ticker:
+            self._ticker = gevent.spawn(self._tick)
+        super().connect()
+
+    def disconnect(self):
+        if self._ticker:
+            self._ticker.kill(block=False)
+            self._ticker = None
+
+    def _tick(self):
+        while True:
+            gevent.sleep(self.tick)
+            if self.paused:
+                continue
+            self._frameBudget += self.fps * self.tick * self._speed
+            frames = int(self._frameBudget)
+            self._frameBudget -= frames
+            for _ in range(frames):
+                self._advance()
+
+    def _advance(self):
+        self.frame += 1
+        while self._jobs and self._jobs[0][0] <= self.frame:
+            _, _, job, args = heapq.heappop(self._jobs)
+            job(*args)
+        self.setValue(Locations.FRAMECOUNT.value, self.frame & 0xffffffff)
+
+    def _later(self, frames, job, *args):
+        heapq.heappush(self._jobs, (self.frame + frames, next(self._sequence),
+                                    job, args))
+
+    def pause(self):
+        self._count("pause")
+        self.paused = True
+
+    def resume(self):
+        self._count("resume")
+        self.paused = False
+
+    def speed(self, speed):
+        self._count("speed")
+        self._speed = speed
+
+    def save(self, filename):
+        # the engine only saves on the battle pass selection or, for
+        # snapshots of prepared teams, on the order selection. The battle
+        # passes, the injected teams and the screen are all there is to it
+        self._count("save")
+        screen = self._screen.name if self._screen in (
+            PbrGuis.BPS_SELECT, PbrGuis.ORDER_SELECT) else None
+        with open(filename, "w") as f:
+            json.dump({"passes": [len(slots) for slots in self._passes],
+                       "screen": screen,
+                       "teams": self.get(_BP_TEAMS, _BP_TEAMS_LENGTH).hex()}, f)
+
+    def load(self, filename):
+        self._count("load")
+        # without a savestate made by save(), the battle passes
+        # still have some pokemon on them from before
+        try:
+            with open(filename) as f:
+                state = json.load(f)
+        except OSError:
+            state = {"passes": [self._random.randint(0, 3) for _ in range(8)]}
+        except ValueError:
+            return False
+        self._jobs = []
+        self._passes = [[None] * size for size in state["passes"]]
+        if state.get("teams"):
+            self.set(_BP_TEAMS, bytes.fromhex(state["teams"]))
+        screen = PbrGuis[state.get("screen") or "BPS_SELECT"]
+        self._page = 0
+        self._ordersLocked = 0
+        self._show(None)
+        self._showLater(screen, CursorOffsets.BPS)
+        return True
+
+    # screens
+
+    def _show(self, screen, cursor=None):
+        self._busy = False
+        old = dict(_SCREENS.get(self._screen, []))
+        new = dict(_SCREENS.get(screen, []))
+        for loc in old:
+            if loc not in new:
+                self.setValue(loc.value, 0)
+        self._screen = screen
+        self.transitions += 1
+        if cursor is not None:
+            self.setValue(Locations.CURSOR_POS.value, cursor)
+        for loc, val in new.items():
+            self.setValue(loc.value, val)
+
+    def _showLater(self, screen, cursor=None, frames=None):
+        self._busy = True
+        self._later(self.delay if frames is None else frames,
+                    self._show, screen, cursor)
+
+    def _write(self, addr, data):
+        super()._write(addr, data)
+        if addr == Locations.INPUT_MOVE.value.addr and \
+                self._screen == PbrGuis.MATCH_MOVE_SELECT:
+            self._later(1, self._choose, ("move", data[0]))
+        elif addr == Locations.GUI_TARGET_MATCH.value.addr and \
+                int.from_bytes(data, "big") == GuiTarget.INSTA_GIVE_IN:
+            self._endMatch()
+
+    def wiiButton(self, wiimote, buttons):
+        self._count("wiiButton")
+        if not buttons or self._busy:
+            return
+        handler = getattr(self, "_on" + str(getattr(self._screen, "name", self._screen)), None)
+        if handler:
+            handler(buttons, self.getValue(Locations.CURSOR_POS.value))
+
+    # main menu
+
+    def _onMENU_MAIN(self, button, cursor):
+        if button == WiimoteButton.TWO and cursor == CursorPosMenu.BP:
+            self._showLater(PbrGuis.MENU_BATTLE_PASS)
+        elif button == WiimoteButton.TWO and cursor == CursorPosMenu.BATTLE:
+            self._showLater(PbrGuis.MENU_BATTLE_TYPE)
+
+    def _onMENU_BATTLE_PASS(self, button, cursor):
+        if button == WiimoteButton.ONE:
+            self._showLater(PbrGuis.MENU_MAIN)
+        elif button == WiimoteButton.TWO:
+            self._showLater(PbrGuis.BPS_SELECT, CursorOffsets.BPS)
+
+    def _onMENU_BATTLE_TYPE(self, button, cursor):
+        if button == WiimoteButton.ONE:
+            self._showLater(PbrGuis.MENU_MAIN)
+        elif button == WiimoteButton.TWO:
+            self._showLater(PbrGuis.MENU_BATTLE_PLAYERS)
+
+    def _onMENU_BATTLE_PLAYERS(self, button, cursor):
+        if button == WiimoteButton.ONE:
+            self._showLater(PbrGuis.MENU_BATTLE_TYPE)
+        elif button == WiimoteButton.TWO:
+            self._showLater(PbrGuis.MENU_BATTLE_REMOTES)
+
+    def _onMENU_BATTLE_REMOTES(self, button, cursor):
+        if button == WiimoteButton.ONE:
+            self._showLater(PbrGuis.MENU_BATTLE_PLAYERS)
+        elif button == WiimoteButton.TWO:
+            self._showLater(PbrGuis.RULES_STAGE, 0)
+
+    # battle passes
+
+    def _onBPS_SELECT(self, button, cursor):
+        if button == WiimoteButton.ONE:
+            self._showLater(PbrGuis.MENU_BATTLE_PASS)
+        elif button != WiimoteButton.TWO:
+            return
+        elif cursor in (CursorPosBP.BP_NEXT, CursorPosBP.BP_PREV):
+            self._page = 1 if cursor == CursorPosBP.BP_NEXT else 0
+        elif CursorOffsets.BPS <= cursor < CursorOffsets.BPS + 4:
+            self._currentPass = self._page * 4 + cursor - CursorOffsets.BPS
+            self._showLater(PbrGuis.BPS_SLOTS, CursorOffsets.BP_SLOTS)
+
+    def _onBPS_SLOTS(self, button, cursor):
+        slots = self._passes[self._currentPass]
+        if button == WiimoteButton.ONE:
+            self._showLater(PbrGuis.BPS_SELECT, CursorOffsets.BPS)
+        elif button == WiimoteButton.TWO and cursor >= CursorOffsets.BP_SLOTS:
+            slot = cursor - CursorOffsets.BP_SLOTS
+            self._filling = slot >= len(slots)
+            if not self._filling:
+                self._showLater(PbrGuis.BPS_PKMN_GRABBED, 0)
+            elif len(slots) < 6:
+                self._showLater(PbrGuis.BPS_BOXES, CursorOffsets.BOX)
+
+    def _onBPS_PKMN_GRABBED(self, button, cursor):
+        if button == WiimoteButton.TWO and cursor == CursorPosBP.REMOVE:
+            self._passes[self._currentPass].pop(0)
+            self._showLater(PbrGuis.BPS_SLOTS, CursorOffsets.BP_SLOTS)
+
+    def _onBPS_BOXES(self, button, cursor):
+        if button == WiimoteButton.ONE:
+            self._showLater(PbrGuis.BPS_SLOTS, CursorOffsets.BP_SLOTS)
+        elif button == WiimoteButton.TWO:
+            self._showLater(PbrGuis.BPS_PKMN, CursorOffsets.PKMN)
+
+    def _onBPS_PKMN(self, button, cursor):
+        if button == WiimoteButton.ONE:
+            self._showLater(PbrGuis.BPS_BOXES, CursorOffsets.BOX)
+        elif button == WiimoteButton.TWO:
+            self._showLater(PbrGuis.BPS_PKMN_CONFIRM, 0)
+            # the cursor only shows up once the model got loaded
+            self._later(self.delay * 3, self.setValue,
+                        Locations.CURSOR_POS.value, 1)
+
+    def _onBPS_PKMN_CONFIRM(self, button, cursor):
+        if button == WiimoteButton.TWO and cursor == 1:
+            slots = self._passes[self._currentPass]
+            slots.append(None)
+            self._showLater(PbrGuis.BPS_SLOTS,
+                            CursorOffsets.BP_SLOTS + len(slots) - 1)
+
+    # rules
+
+    def _onRULES_STAGE(self, button, cursor):
+        if button == WiimoteButton.ONE:
+            self._showLater(PbrGuis.MENU_BATTLE_REMOTES)
+        elif button == WiimoteButton.TWO:
+            self._showLater(PbrGuis.RULES_SETTINGS, 0)
+
+    def _onRULES_SETTINGS(self, button, cursor):
+        if button != WiimoteButton.TWO:
+            return
+        if cursor == 1:
+            self._showLater(_RULESET, CursorOffsets.RULESETS)
+        elif cursor == 2:
+            self._showLater(PbrGuis.RULES_BATTLE_STYLE, 0)
+        elif cursor == 3:
+            self._bpSelections = 0
+            self._showLater(PbrGuis.BPSELECT_SELECT, CursorOffsets.BPS)
+
+    def _onruleset(self, button, cursor):
+        if button != WiimoteButton.TWO:
+            return
+        if cursor == CursorPosMenu.RULES_CONFIRM:
+            self._showLater(PbrGuis.RULES_SETTINGS, 0)
+        else:
+            self._later(self.delay, self.setValue, Locations.CURSOR_POS.value,
+                        CursorPosMenu.RULES_CONFIRM)
+
+    def _onRULES_BATTLE_STYLE(self, button, cursor):
+        if button == WiimoteButton.TWO:
+            self._showLater(PbrGuis.RULES_SETTINGS, 0)
+
+    def _onBPSELECT_SELECT(self, button, cursor):
+        if button != WiimoteButton.TWO:
+            return
+        if cursor in (CursorPosBP.BP_NEXT, CursorPosBP.BP_PREV):
+            self._page = 1 if cursor == CursorPosBP.BP_NEXT else 0
+        elif CursorOffsets.BPS <= cursor < CursorOffsets.BPS + 4:
+            self._showLater(PbrGuis.BPSELECT_CONFIRM, 0)
+
+    def _onBPSELECT_CONFIRM(self, button, cursor):
+        if button != WiimoteButton.TWO:
+            return
+        self._bpSelections += 1
+        if self._bpSelections < 2:
+            self._showLater(PbrGuis.BPSELECT_SELECT, CursorOffsets.BPS)
+        else:
+            self._intro = False
+            self._showLater(PbrGuis.RULES_BPS_CONFIRM)
+
+    def _onRULES_BPS_CONFIRM(self, button, cursor):
+        # the intro, which can be skipped by pressing 2 again
+        if button != WiimoteButton.TWO:
+            return
+        if self._intro:
+            self._ordersLocked = 0
+            self._showLater(PbrGuis.ORDER_SELECT)
+        self._intro = True
+
+    # order selection
+
+    def _onORDER_SELECT(self, button, cursor):
+        lock = Locations.ORDER_LOCK_RED if self._ordersLocked else \
+            Locations.ORDER_LOCK_BLUE
+        if button == WiimoteButton.RIGHT:
+            self._later(self.delay, self.setValue, lock.value, 1)
+        elif button == WiimoteButton.ONE and self.getValue(lock.value):
+            self._showLater(PbrGuis.ORDER_CONFIRM)
+
+    def _onORDER_CONFIRM(self, button, cursor):
+        if button != WiimoteButton.TWO:
+            return
+        self._ordersLocked += 1
+        if self._ordersLocked < 2:
+            self._showLater(PbrGuis.ORDER_SELECT)
+        else:
+            self._later(self.delay, self._startMatch)
+
+    # match
+
+    def _readTeam(self, offset):
+        team = []
+        for i in range(6):
+            addr = _BP_STRUCT + offset + i * _BP_PKMN_STRIDE
+            if not any(self.get(addr, 8)):
+                break
+            team.append(decode_name(self.get(addr + _NAME_OFFSET, 22)))
+        return team
+
+    def _startMatch(self):
+        self.setValue(Locations.ORDER_LOCK_BLUE.value, 0)
+        self.setValue(Locations.ORDER_LOCK_RED.value, 0)
+        self._teams = {0: self._readTeam(BPStructOffsets.PKMN_BLUE),
+                       1: self._readTeam(BPStructOffsets.PKMN_RED)}
+        self._hp = {side: [100] * len(team) for side, team in self._teams.items()}
+        self._pp = {side: [[10] * 4 for _ in team]
+                    for side, team in self._teams.items()}
+        self._current = {0: 0, 1: 0}
+        self._choices = {}
+        for side in (0, 1):
+            self._setHp(side)
+            self._setPp(side)
+        self._show(PbrGuis.MATCH_FADE_IN)
+        self._later(self.delay * 6, self._nextInput, 0)
+
+    def _setHp(self, side):
+        loc = Locations.HP_BLUE if side == 0 else Locations.HP_RED
+        self.setValue(loc.value, self._hp[side][self._current[side]])
+
+    def _setPp(self, side):
+        loc = Locations.BATTLE_BLUE if side == 0 else Locations.BATTLE_RED
+        self.set(loc.value.addr + BattleStructOffsets.PP,
+                 bytes(self._pp[side][self._current[side]]))
+
+    def _nextInput(self, player):
+        self._player = player
+        self.setValue(Locations.WHICH_PLAYER.value, player)
+        self._show(PbrGuis.MATCH_MOVE_SELECT)
+
+    def _choose(self, choice):
+        self._choices[self._player] = choice
+        self.setValue(Locations.GUI_STATE_MATCH_PKMN_MENU.value, 0)
+        self._show(PbrGuis.MATCH_IDLE)
+        if self._player == 0:
+            self._later(self.delay, self._nextInput, 1)
+        else:
+            self._later(self.delay, self._runTurn)
+
+    def _onMATCH_MOVE_SELECT(self, button, cursor):
+        if button == WiimoteButton.TWO:
+            self._showLater(PbrGuis.MATCH_PKMN_SELECT)
+
+    def _onMATCH_PKMN_SELECT(self, button, cursor):
+        if button == WiimoteButton.MINUS:
+            self.setValue(Locations.GUI_STATE_MATCH_PKMN_MENU.value, 0)
+            self._showLater(PbrGuis.MATCH_MOVE_SELECT)
+            return
+        if button not in _PKMN_BUTTONS:
+            return
+        index = _PKMN_BUTTONS.index(button)
+        hp = self._hp[self._player]
+        if index >= len(hp) or not hp[index] or index == self._current[self._player]:
+            return  # the game would show a popup, let the engine retry
+        if self._choices.get(self._player) == "fainted":
+            # forced switch after fainting, doesn't take a turn
+            self._choices.pop(self._player)
+            self._switch(self._player, index)
+            self.setValue(Locations.GUI_STATE_MATCH_PKMN_MENU.value, 0)
+            self._show(PbrGuis.MATCH_IDLE)
+            self._later(self.delay, self._afterTurn)
+        else:
+            self._choose(("switch", index))
+
+    def _switch(self, side, index):
+        self._current[side] = index
+        self._setHp(side)
+        self._setPp(side)
+
+    def _runTurn(self):
+        frames = self.delay
+        order = [0, 1]
+        self._random.shuffle(order)  # speed ties all the way
+        for side in order:
+            action, index = self._choices.pop(side)
+            if action == "switch":
+                self._later(frames, self._switch, side, index)
+            else:
+                self._later(frames, self._attack, side, index)
+            frames += self.delay * 9
+        self._later(frames, self._afterTurn)
+
+    def _attack(self, side, move):
+        if not self._hp[side][self._current[side]]:
+            return  # fainted before it could move
+        team = "Blue" if side == 0 else "Red"
+        name = self._teams[side][self._current[side]]
+        self.set(Locations.ATTACK_TEXT.value.addr,
+                 _text("Team %s's %s used" % (team, name), 0x40) +
+                 _text("Move %d!" % (move + 1), 0x40))
+        pp = self._pp[side][self._current[side]]
+        pp[move] = max(0, pp[move] - 1)
+        self._setPp(side)
+        target = 1 - side
+        hp = self._hp[target]
+        hp[self._current[target]] = max(0, hp[self._current[target]] -
+                                        self._random.randint(20, 60))
+        self._later(self.delay * 3, self._setHp, target)
+        if self._random.random() < 0.25:
+            self._later(self.delay * 4, self.set,
+                        Locations.EFFECTIVE_TEXT.value.addr,
+                        _text("It's super effective!", 0x50))
+        if not hp[self._current[target]]:
+            other = "Red" if side == 0 else "Blue"
+            name = self._teams[target][self._current[target]]
+            self._later(self.delay * 6, self.set, Locations.INFO_TEXT.value.addr,
+                        _text("Team %s's %s fainted!" % (other, name), 150))
+
+    def _afterTurn(self):
+        if self._screen not in (PbrGuis.MATCH_IDLE, PbrGuis.MATCH_MOVE_SELECT):
+            return  # match got given up in the meantime
+        if not any(self._hp[0]) or not any(self._hp[1]):
+            self._endMatch()
+            return
+        for side in (0, 1):
+            if not self._hp[side][self._current[side]]:
+                self._choices[side] = "fainted"
+                self._player = side
+                self.setValue(Locations.WHICH_PLAYER.value, side)
+                self._show(PbrGuis.MATCH_PKMN_SELECT)
+                return
+        self._nextInput(0)
+
+    def _endMatch(self):
+        self.matches += 1
+        self._show(None, 0)
+        # the engine waits for the outcome to be certain,
+        # then quits via "Continue/Change Rules/Quit"
+        self._screen = "end"
+        self._later(self.delay * 80, self.setValue,
+                    Locations.CURSOR_POS.value, 1)
+
+    def _onend(self, button, cursor):
+        if button == WiimoteButton.TWO and cursor == 3:
+            self._showLater(None)
+
+
+class DolphinWatchServer(object):
+    '''
+    Serves a SimulatedDolphin over TCP with dolphinWatch's protocol,
+    so an engine connects to it with a regular DolphinConnection like to a
+    real Dolphin, including the socket I/O and parsing on both ends.
+    Commands and messages are lines of space separated fields, e.g.
+    "SUBSCRIBE 32 6552620" or "MEM_MULTI 4673848 84 0 101 ...".
+    Like Dolphin, it only serves one game, but any number of clients.
+    Each client has its own subscriptions, which get dropped when it
+    disconnects or unsubscribes, without affecting the other clients.
+    Use serve() to run games in a process of their own, so they don't
+    share a hub with the engines.
+    '''
+    def __init__(self, dolphin, host="localhost", port=6000):
+        self.dolphin = dolphin
+        self._server = StreamServer((host, port), self._handle)
+        self._clients = []
+
+    def start(self):
+        self.dolphin.connect()  # starts the game
+        self._server.start()
+
+    def serve_forever(self):
+        self.start()
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.stop()
+        self.dolphin.disconnect()
+
+    def _handle(self, sock, address):
+        client = _Client(self.dolphin, sock)
+        self._clients.append(client)
+        try:
+            for line in sock.makefile("r", encoding="utf-8"):
+                if line.strip():
+                    client.process(line.strip())
+        except OSError:
+            pass
+        finally:
+            self._clients.remove(client)
+            client.close()
+
+
+class _Client(object):
+    # one connection of a DolphinWatchServer
+    def __init__(self, dolphin, sock):
+        self._dolphin = dolphin
+        self._sock = sock
+        self._subscriptions = []
+
+    def send(self, message):
+        try:
+            self._sock.sendall((message + "\n").encode("utf-8"))
+        except OSError:
+            pass  # the reader notices too and cleans up
+
+    def _mem(self, addr, val):
+        self.send("MEM %d %d" % (addr, val))
+
+    def _memMulti(self, addr, data):
+        self.send("MEM_MULTI %d %s" % (addr, " ".join(map(str, data))))
+
+    def process(self, line):
+        cmd, _, args = line.partition(" ")
+        handler = getattr(self, "_cmd" + cmd, None)
+        if not handler:
+            logger.warning("Unknown dolphinWatch command: %s", line)
+            self.send("FAIL Unknown command: %s" % cmd)
+            return
+        try:
+            handler(args)
+        except ValueError:
+            logger.warning("Invalid dolphinWatch command: %s", line)
+            self.send("FAIL Invalid arguments: %s" % line)
+
+    def close(self):
+        for addr in self._subscriptions:
+            self._dolphin.unSubscribe(addr, owner=self)
+        self._subscriptions = []
+
+    # commands, each getting the rest of the line
+
+    def _cmdWRITE(self, args):
+        bits, addr, val = map(int, args.split())
+        getattr(self._dolphin, "write%d" % bits)(addr, val)
+
+    def _cmdWRITE_MULTI(self, args):
+        addr, *data = map(int, args.split())
+        self._dolphin.writeMulti(addr, data)
+
+    def _cmdREAD(self, args):
+        bits, addr = map(int, args.split())
+        self._mem(addr, int.from_bytes(self._dolphin._read(addr, bits // 8),
+                                       "big"))
+
+    def _cmdREAD_MULTI(self, args):
+        addr, size = map(int, args.split())
+        self._memMulti(addr, self._dolphin._read(addr, size))
+
+    def _cmdSUBSCRIBE(self, args):
+        bits, addr = map(int, args.split())
+        self._subscriptions.append(addr)
+        self._dolphin._subscribe(bits, addr, partial(self._mem, addr),
+                                 owner=self)
+
+    def _cmdSUBSCRIBE_MULTI(self, args):
+        size, addr = map(int, args.split())
+        self._subscriptions.append(addr)
+        self._dolphin._subscribeMulti(size, addr, partial(self._memMulti, addr),
+                                      owner=self)
+
+    def _cmdUNSUBSCRIBE(self, args):
+        addr = int(args)
+        if addr in self._subscriptions:
+            self._subscriptions.remove(addr)
+        self._dolphin.unSubscribe(addr, owner=self)
+
+    _cmdUNSUBSCRIBE_MULTI = _cmdUNSUBSCRIBE
+
+    def _cmdBUTTONSTATES_WII(self, args):
+        wiimote, buttons = map(int, args.split())
+        self._dolphin.wiiButton(wiimote, buttons)
+
+    def _cmdPAUSE(self, args):
+        self._dolphin.pause()
+
+    def _cmdRESUME(self, args):
+        self._dolphin.resume()
+
+    def _cmdSPEED(self, args):
+        self._dolphin.speed(float(args))
+
+    def _cmdVOLUME(self, args):
+        self._dolphin.volume(int(args))
+
+    def _cmdSAVE(self, args):
+        self._dolphin.save(args.strip())
+
+    def _cmdLOAD(self, args):
+        if not self._dolphin.load(args.strip()):
+            self.send("FAIL Loading %s failed" % args.strip())
+
+
+def serve(games=1, port=6000, host="localhost", **kwargs):
+    '''
+    Serves <games> SimulatedDolphins, made with <kwargs>, at <port>,
+    <port>+1 and so on until the process gets killed.
+    '''
+    servers = [DolphinWatchServer(SimulatedDolphin(**kwargs), host, port + i)
+               for i in range(games)]
+    for server in servers[:-1]:
+        server.start()
+    servers[-1].serve_forever()
+
+
+if __name__ == "__main__":
+    # python -m pbrEngine.simulation [games] [port] [fps]
+    import sys
+    logging.basicConfig(level=logging.WARNING)
+    serve(int(sys.argv[1]) if len(sys.argv) > 1 else 1,
+          int(sys.argv[2]) if len(sys.argv) > 2 else 6000,
+          fps=float(sys.argv[3]) if len(sys.argv) > 3 else 6000)
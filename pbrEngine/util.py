@@ -6,7 +6,19 @@ Created on 04.09.2015
 
 import struct
 import inspect
+import logging
 import gevent
+from enum import Enum
+from functools import lru_cache
+from gevent.queue import Queue, Full
+
+logger = logging.getLogger("pbrEngine")
+
+
+class DispatchMode(Enum):
+    SPAWN = "spawn"    # one new greenlet per listener and call
+    POOL = "pool"      # one worker greenlet per hook, working off a queue
+    INLINE = "inline"  # listeners are called synchronously by the caller
 
 
 class EventHook(object):
@@ -15,10 +27,12 @@ class EventHook(object):
     The user can specify an event signature upon inizializazion,
     defined by kwargs in the form of argumentname=class (e.g. id=int).
     Callables with a fitting signature can be added with += or removed with -=.
+    The signature is only checked when adding a listener, not on each call.
     All listeners can be notified by calling the EventHook class with fitting
     arguments.
-    The listener's calling are getting scheduled with gevent. The spawned
-    Greenlets are returned as a list.
+    How the listeners get called depends on the dispatch mode,
+    see setDispatchMode(). By default, the listener's calling are getting
+    scheduled with gevent. The spawned Greenlets are returned as a list.
 
     >>> event = EventHook(id=int, data=dict)
     >>> event += lambda id, data: print("%d %s" % (id, data))
@@ -33,21 +47,54 @@ class EventHook(object):
     ValueError: Listener must have these arguments: (id=int)
 
     >>> event = EventHook(id=int)
-    >>> event += lambda id: None
-    >>> event(wrong_name=0)
-    Traceback (most recent call last):
-        ...
-    ValueError: This EventHook must be called with these arguments: (id=int)
+    >>> event.setDispatchMode(DispatchMode.INLINE)
+    >>> event += lambda id: print(id)
+    >>> event(id=5)
+    5
+    []
     '''
     def __init__(self, **signature):
         self.__signature = signature
         self.__argnames = set(signature.keys())
         self.__handlers = []
+        self.__mode = DispatchMode.SPAWN
+        self.__queue = None
+        self.__worker = None
+        self.validate = True  # check listeners' signatures when added
+        self.dropped = 0  # events dropped because the queue was full
 
     def __kwargs_str(self):
         return ", ".join(k+"="+v.__name__ for k, v in self.__signature.items())
 
+    def setDispatchMode(self, mode, queue_size=64):
+        '''
+        Sets how listeners get called:
+        DispatchMode.SPAWN: spawns a greenlet per listener for every event.
+        DispatchMode.POOL: queues the event for a single worker greenlet,
+            which calls the listeners one after another. If <queue_size>
+            events are waiting already, the event gets dropped and counted
+            in <dropped>. The first dropped event gets logged.
+        DispatchMode.INLINE: calls the listeners right away. Listeners must
+            not block then, because the caller does.
+        '''
+        if self.__worker:
+            self.__worker.kill(block=False)
+            self.__worker = None
+        self.__mode = mode
+        self.__queue = Queue(queue_size) if mode == DispatchMode.POOL else None
+
+    @property
+    def queue_depth(self):
+        '''Number of events waiting to be dispatched in pool mode.'''
+        return self.__queue.qsize() if self.__queue else 0
+
     def __iadd__(self, handler):
+        if self.validate:
+            self.__validate(handler)
+        self.__handlers.append(handler)
+        return self
+
+    def __validate(self, handler):
         params = inspect.signature(handler).parameters
         valid = True
         argnames = set(n for n in params.keys())
@@ -63,26 +110,70 @@ class EventHook(object):
         if not valid:
             raise ValueError("Listener must have these arguments: (%s)"
                              % self.__kwargs_str())
-        self.__handlers.append(handler)
-        return self
 
     def __isub__(self, handler):
         self.__handlers.remove(handler)
         return self
 
-    def __call__(self, *args, **kwargs):
-        if args or (set(kwargs.keys()) != self.__argnames):
-            raise ValueError("This EventHook must be called with these " +
-                             "keyword arguments: (%s)" % self.__kwargs_str())
+    def __call__(self, **kwargs):
+        if self.__mode == DispatchMode.INLINE:
+            self.__dispatch(kwargs)
+            return []
+        if self.__mode == DispatchMode.POOL:
+            try:
+                self.__queue.put_nowait(kwargs)
+            except Full:
+                if not self.dropped:
+                    logger.warning("Queue of %r is full, dropping events. "
+                                   "A listener might be blocking", self)
+                self.dropped += 1
+            if not self.__worker:
+                self.__worker = gevent.spawn(self.__work)
+            return []
         greenlets = []
         for handler in self.__handlers:
             greenlets.append(gevent.spawn(handler, **kwargs))
         return greenlets
 
+    def __dispatch(self, kwargs):
+        # iterate over a copy, listeners might remove themselves
+        for handler in list(self.__handlers):
+            try:
+                handler(**kwargs)
+            except Exception:
+                logger.exception("Listener of %r failed", self)
+
+    def __work(self):
+        while True:
+            self.__dispatch(self.__queue.get())
+
     def __repr__(self):
         return "EventHook(%s)" % self.__kwargs_str()
 
 
+# applied to every decoded PBR string, see bytesToString()
+_TRANSLATION = str.maketrans({
+    "\uffff": None,
+    "\ufffe": " ",
+    "\u3328": "\u2642",
+    "\u3329": "\u2640",
+})
+
+
+def _cString(data):
+    # the raw bytes up to the first (aligned) 2 byte 0 terminator
+    raw = bytes(data)
+    end = raw.find(b"\0\0")
+    while end > 0 and end % 2:
+        end = raw.find(b"\0\0", end + 1)
+    return raw[:end if end >= 0 else len(raw) & ~1]
+
+
+@lru_cache(maxsize=512)
+def _decode(raw):
+    return raw.decode("utf-16be", "ignore").translate(_TRANSLATION)
+
+
 def bytesToString(data):
     '''
     Helper method to turn a list of bytes stripped from PBR's memory
@@ -90,22 +181,71 @@ def bytesToString(data):
     and stopping at the first "0", because they are c-strings.
     0xfe gets replaced with a space,
     because it represents (part of) a line break.
+    The same texts come up over and over, so the results are memoized.
+    '''
+    return _decode(_cString(data))
+
+
+def encodeString(string):
+    '''
+    Turns a string into the raw bytes PBR would store it as,
+    without the terminator. Used to compare memory without decoding it.
+    '''
+    return string.translate({0x2642: "\u3328", 0x2640: "\u3329"})\
+        .encode("utf-16be")
+
+
+# what the engine overwrites texts with to get notified of the next change
+_INVALIDATED = encodeString("##")
+
+
+def isInvalidated(data):
+    '''Returns whether a PBR string starts with the "##" invalidation.'''
+    return bytes(data[:len(_INVALIDATED)]) == _INVALIDATED
+
+
+# space and the two halves of a line break
+_BLANKS = {encodeString(" "), b"\xff\xff", b"\xff\xfe"}
+
+
+class TextRecognizer(object):
     '''
-    chars = []
-    for i in range(0, len(data), 2):
-        character = bytes(data[i:i+2]).decode("utf-16be")
-        if character == '\x00':
-            break  # end of string
-        _replacements = {
-            "\uffff": "",
-            "\ufffe": " ",
-            "\u3328": "\u2642",
-            "\u3329": "\u2640",
-        }
-        for needle, replacement in _replacements.items():
-            character = character.replace(needle, replacement)
-        chars.append(character)
-    return "".join(chars)
+    Maps known texts to values by comparing raw bytes from PBR's memory,
+    which only get decoded if that doesn't find anything.
+
+    >>> recognizer = TextRecognizer({"Team Blue's ": "blue",
+    ...                              "Team Red's ": "red"})
+    >>> recognizer.prefix(stringToBytes("Team Red's Onix used Bind!"))
+    'red'
+    '''
+    def __init__(self, texts):
+        self._texts = dict(texts)
+        self._patterns = {encodeString(text): value
+                          for text, value in self._texts.items()}
+        # longest first, in case one is the prefix of another
+        self._prefixes = sorted(self._patterns.items(),
+                                key=lambda item: -len(item[0]))
+
+    def get(self, data, default=None):
+        '''Returns the value of the text <data> as a whole is, or <default>.'''
+        raw = _cString(data)
+        if raw in self._patterns:
+            return self._patterns[raw]
+        # e.g. line breaks decode to spaces
+        return self._texts.get(_decode(raw), default)
+
+    def prefix(self, data, default=None):
+        '''
+        Returns the value of the text <data> starts with, or <default>.
+        Leading spaces and line breaks are skipped, like str.strip() would.
+        '''
+        raw = bytes(data)
+        while raw[:2] in _BLANKS:
+            raw = raw[2:]
+        for pattern, value in self._prefixes:
+            if raw.startswith(pattern):
+                return value
+        return default
 
 
 def stringToBytes(string):
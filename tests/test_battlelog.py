@@ -0,0 +1,105 @@
+'''
+Created on 18.10.2026
+
+Tests of the battle message classification.
+'''
+
+import unittest
+
+from pbrEngine.battlelog import CATALOG, BattleLog, BattleEvents, classify
+
+# what each placeholder gets filled with, and what it should come out as
+_SAMPLES = {
+    "pkmn": ("Team Red's MR. MIME", {"side": "red", "pkmn": "MR. MIME"}),
+    "target": ("Team Blue's NIDORAN♀", {"target": "NIDORAN♀"}),
+    "value": ("Sticky Barb", {"value": "Sticky Barb"}),
+    "stat": ("Sp. Atk", {"value": "Sp. Atk"}),
+    "move": ("Will-O-Wisp", {"value": "Will-O-Wisp"}),
+}
+
+
+def _sample(message, value, amount):
+    # fills in the placeholders of a catalog message
+    text = message
+    expected = {"side": None, "pkmn": None, "value": value, "amount": amount,
+                "target": None}
+    for name, (filler, fields) in _SAMPLES.items():
+        if "{%s}" % name in text:
+            text = text.replace("{%s}" % name, filler)
+            expected.update(fields)
+    return text, expected
+
+
+class TestCatalog(unittest.TestCase):
+    def assertEvent(self, event, kind, **fields):
+        self.assertEqual(event.kind, kind)
+        for name, value in fields.items():
+            self.assertEqual(getattr(event, name), value, name)
+
+    def test_every_entry(self):
+        for kind, message, value, amount in CATALOG:
+            text, expected = _sample(message, value, amount)
+            with self.subTest(text=text):
+                event = classify(text)
+                self.assertEqual(event.text, text)
+                self.assertEvent(event, kind, **expected)
+
+    def test_entries_are_needed(self):
+        # without an entry, its message must come out differently
+        for i, (kind, message, value, amount) in enumerate(CATALOG):
+            text, _ = _sample(message, value, amount)
+            with self.subTest(text=text):
+                event = BattleLog(CATALOG[:i] + CATALOG[i+1:]).classify(text)
+                self.assertNotEqual((event.kind, event.value, event.amount),
+                                    (kind, value, amount))
+
+    def test_unknown(self):
+        for text in ("But it failed!", "", "Team Red's ONIX used",
+                     "A critical hit! Something else!"):
+            with self.subTest(text=text):
+                self.assertEvent(classify(text), BattleEvents.OTHER, side=None,
+                                 pkmn=None, value=None, text=text)
+
+
+class TestPriority(unittest.TestCase):
+    def test_burn_damage_before_item(self):
+        event = classify("Team Blue's ONIX is hurt by its burn!")
+        self.assertEqual((event.kind, event.value), (BattleEvents.DAMAGE, "brn"))
+        event = classify("Team Blue's ONIX is hurt by its Sticky Barb!")
+        self.assertEqual((event.kind, event.value),
+                         (BattleEvents.ITEM, "Sticky Barb"))
+
+    def test_used_in_name(self):
+        cases = [
+            ("Team Blue's USEDUP used Tackle!",
+             BattleEvents.MOVE, "USEDUP", "Tackle"),
+            ("Team Blue's CAUSED used Bind!",
+             BattleEvents.MOVE, "CAUSED", "Bind"),
+            ("Team Red's I used it used U-turn!",
+             BattleEvents.MOVE, "I used it", "U-turn"),
+            ("Team Red's A used fainted!",
+             BattleEvents.FAINTED, "A used", None),
+            ("Team Red's A used B's Attack rose!",
+             BattleEvents.STAT_CHANGE, "A used B", "Attack"),
+            ("Team Red's USED was burned!",
+             BattleEvents.STATUS, "USED", "brn"),
+        ]
+        for text, kind, pkmn, value in cases:
+            with self.subTest(text=text):
+                event = classify(text)
+                self.assertEqual((event.kind, event.pkmn, event.value),
+                                 (kind, pkmn, value))
+
+    def test_critical_and_effectiveness(self):
+        self.assertEqual(classify("A critical hit!").value, None)
+        for text, value in (("A critical hit! It's super effective!", "super"),
+                            ("A critical hit! It's not very effective...",
+                             "not very")):
+            with self.subTest(text=text):
+                event = classify(text)
+                self.assertEqual((event.kind, event.value),
+                                 (BattleEvents.CRITICAL, value))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,184 @@
+'''
+Created on 18.10.2026
+
+Tests of reading both teams' state from the battle structs.
+'''
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import gevent
+
+from pbrEngine import PBREngine
+from pbrEngine.states import PbrStates
+from pbrEngine.abstractions.battlestate import BattleState
+from pbrEngine.abstractions.match import Match
+from pbrEngine.abstractions.timer import Timer
+from pbrEngine.memorymap.addresses import Locations
+from pbrEngine.memorymap.values import BattleStructOffsets
+from pbrEngine.simulation import SimulatedDolphin
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _struct(hp, status=0, pp=(10, 10, 10, 10)):
+    data = bytearray(Locations.BATTLE_BLUE.value.length)
+    data[BattleStructOffsets.PP:BattleStructOffsets.PP+4] = bytes(pp)
+    data[BattleStructOffsets.STATUS] = status
+    data[BattleStructOffsets.HP:BattleStructOffsets.HP+2] = hp.to_bytes(2, "big")
+    return bytes(data)
+
+
+class TestLayout(unittest.TestCase):
+    def test_struct_covers_subscribed_locations(self):
+        for struct, status, hp, pp in (
+                (Locations.BATTLE_BLUE, Locations.STATUS_BLUE,
+                 Locations.HP_BLUE, Locations.PP_BLUE),
+                (Locations.BATTLE_RED, Locations.STATUS_RED,
+                 Locations.HP_RED, Locations.PP_RED)):
+            base = struct.value.addr
+            self.assertEqual(base + BattleStructOffsets.STATUS, status.value.addr)
+            self.assertEqual(base + BattleStructOffsets.HP, hp.value.addr)
+            self.assertEqual(base + BattleStructOffsets.PP, pp.value.addr)
+            self.assertLessEqual(hp.value.addr + hp.value.length,
+                                 base + struct.value.length)
+        self.assertEqual(Locations.BATTLE_RED.value.addr -
+                         Locations.BATTLE_BLUE.value.addr, 0xa50)
+
+    def test_regions(self):
+        self.assertEqual(BattleState.regions(), [
+            ("blue", Locations.BATTLE_BLUE.value.addr, 0x20),
+            ("red", Locations.BATTLE_RED.value.addr, 0x20)])
+
+
+class TestDiff(unittest.TestCase):
+    def setUp(self):
+        self.match = Match(Timer())
+        self.match.new([{"ingamename": name} for name in ("A", "B", "C")],
+                       [{"ingamename": name} for name in ("D", "E")])
+        self.state = BattleState(self.match)
+        self.state.reset()
+
+    def fields(self, changes):
+        return {(c["side"], c["monindex"], c["field"]): (c["old"], c["new"])
+                for c in changes}
+
+    def test_first_read(self):
+        changes = self.state.update("blue", _struct(200), frame=5)
+        self.assertEqual(self.fields(changes), {
+            ("blue", 0, "active"): (None, 0),
+            ("blue", 0, "hp"): (None, 200),
+            ("blue", 0, "pp"): (None, [10, 10, 10, 10]),
+        })
+        self.assertEqual(self.state.frame, 5)
+
+    def test_unchanged(self):
+        self.state.update("red", _struct(150))
+        self.assertEqual(self.state.update("red", _struct(150)), [])
+
+    def test_changes(self):
+        self.state.update("blue", _struct(200))
+        changes = self.state.update("blue", _struct(120, 0x10, (9, 10, 10, 10)))
+        self.assertEqual(self.fields(changes), {
+            ("blue", 0, "hp"): (200, 120),
+            ("blue", 0, "status"): (None, "brn"),
+            ("blue", 0, "pp"): ([10, 10, 10, 10], [9, 10, 10, 10]),
+        })
+        changes = self.state.update("blue", _struct(120, 0x03, (9, 10, 10, 10)))
+        self.assertEqual(self.fields(changes), {
+            ("blue", 0, "status"): ("brn", "slp"),
+            ("blue", 0, "sleep"): (None, 3),
+        })
+
+    def test_switch(self):
+        self.state.update("blue", _struct(200, pp=(9, 10, 10, 10)))
+        self.match.current_blue = 2
+        # the match knows of the switch before it happened in memory
+        changes = self.state.update("blue", _struct(200, pp=(9, 10, 10, 10)))
+        self.assertEqual(changes, [])
+        changes = self.state.update("blue", _struct(90))
+        self.assertEqual(self.fields(changes), {
+            ("blue", 2, "active"): (0, 2),
+            ("blue", 2, "hp"): (None, 90),
+            ("blue", 2, "pp"): (None, [10, 10, 10, 10]),
+        })
+        # the pokemon not in memory keeps what was read last
+        teams = self.state.snapshot()["teams"]
+        self.assertEqual(teams["blue"][0]["hp"], 200)
+        self.assertEqual(teams["blue"][1]["hp"], None)
+        self.assertEqual(teams["red"][0]["hp"], None)
+        self.assertEqual(self.state.snapshot()["active"],
+                         {"blue": 2, "red": None})
+
+    def test_switch_back(self):
+        self.state.update("blue", _struct(200, pp=(9, 10, 10, 10)))
+        self.match.current_blue = 1
+        self.state.update("blue", _struct(150, pp=(10, 10, 8, 10)))
+        self.match.current_blue = 0
+        # hit before switching out, neither the old nor the one coming back
+        changes = self.state.update("blue", _struct(100, pp=(10, 10, 8, 10)))
+        self.assertEqual(changes, [])
+        self.assertEqual(self.state.teams["blue"][1].hp, 150)
+        changes = self.state.update("blue", _struct(200, pp=(9, 10, 10, 10)))
+        self.assertEqual(self.fields(changes), {("blue", 0, "active"): (1, 0)})
+
+    def test_switch_same_pp(self):
+        self.state.update("red", _struct(150))
+        self.match.current_red = 1
+        # can't tell the new one apart until it used a move
+        self.assertEqual(self.state.update("red", _struct(180)), [])
+        changes = self.state.update("red", _struct(180, pp=(10, 9, 10, 10)))
+        self.assertEqual(self.fields(changes), {
+            ("red", 1, "active"): (0, 1),
+            ("red", 1, "hp"): (None, 180),
+            ("red", 1, "pp"): (None, [10, 9, 10, 10]),
+        })
+        self.assertEqual(self.state.teams["red"][0].hp, 150)
+
+    def test_switch_not_noticed(self):
+        self.state.update("red", _struct(150, pp=(5, 10, 10, 10)))
+        # e.g. dragged out by Roar, the match doesn't know yet
+        self.assertEqual(self.state.update("red", _struct(180)), [])
+        self.assertEqual(self.state.teams["red"][0].hp, 150)
+        self.match.current_red = 1
+        changes = self.state.update("red", _struct(180))
+        self.assertEqual(self.fields(changes)[("red", 1, "active")], (0, 1))
+
+    def test_before_reset(self):
+        self.assertEqual(BattleState(self.match).update("blue", _struct(1)), [])
+
+
+class TestPolling(unittest.TestCase):
+    def test_engine_reports_pp(self):
+        with open(os.path.join(_ROOT, "testpkmn.json"), encoding="utf-8") as f:
+            pkmn = json.load(f)[:6]
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        dolphin = SimulatedDolphin(fps=6000, seed=0)
+        self.addCleanup(dolphin.disconnect)
+        pbr = PBREngine(lambda side, fails, moves, switch, cause: ("a", None),
+                        dolphin=dolphin, savefile_dir=directory,
+                        battle_state_interval=30)
+        batches = []
+
+        def onBattleState(changes):
+            batches.append(changes)
+        pbr.on_battle_state += onBattleState
+        pbr.connect()
+        pbr.new(0, pkmn[:3], pkmn[3:])
+        with gevent.Timeout(60):
+            while pbr.state != PbrStates.WAITING_FOR_START:
+                gevent.sleep(0.1)
+            pbr.start()
+            while not any(c["field"] == "pp" and c["old"]
+                          for batch in batches for c in batch):
+                gevent.sleep(0.1)
+        pp = pbr.battle_state.snapshot()["teams"]["blue"][0]["pp"]
+        self.assertEqual(pp[1:], [10, 10, 10])
+        self.assertLess(pp[0], 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+'''
+Created on 18.10.2026
+
+Tests of the plain python pokemon codec against libeps.
+'''
+
+import os
+import sys
+import json
+import random
+import unittest
+import subprocess
+
+from pbrEngine.eps import codec, factory
+
+try:
+    from pbrEngine.eps import eps as libeps
+except OSError:  # libeps can't be loaded on this platform
+    libeps = None
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_STATS = ("hp", "atk", "def", "spe", "spA", "spD")
+
+
+def _randomPokeset(rng):
+    name = "".join(rng.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789 -.♂♀")
+                   for _ in range(rng.randint(1, 10)))
+    return {
+        "species": {"id": rng.randint(1, 493)},
+        "item": {"id": rng.randint(0, 300)},
+        "level": rng.randint(1, 100),
+        "ingamename": name,
+        "ability": {"id": rng.randint(1, 123)},
+        "shiny": rng.random() < 0.5,
+        "gender": rng.choice(("m", "f", None)),
+        "nature": {"id": rng.randint(0, 24)},
+        "form": rng.randint(0, 27),
+        "happiness": rng.randint(0, 255),
+        "ball": {"id": rng.randint(1, 16)},
+        "ivs": {stat: rng.randint(0, 31) for stat in _STATS},
+        "evs": {stat: rng.randint(0, 255) for stat in _STATS},
+        "moves": [{"id": rng.randint(1, 467), "pp": rng.randint(0, 64),
+                   "pp_ups": rng.randint(0, 3)}
+                  for _ in range(rng.randint(1, 4))],
+    }
+
+
+@unittest.skipIf(libeps is None, "libeps is not available")
+class TestParity(unittest.TestCase):
+    def assertParity(self, pokesets):
+        for data in pokesets:
+            with self.subTest(name=data["ingamename"]):
+                self.assertEqual(codec.encode(data),
+                                 factory.get_pokemon_bytes(data))
+
+    def test_corpus(self):
+        with open(os.path.join(_ROOT, "testpkmn.json"), encoding="utf-8") as f:
+            pokesets = json.load(f)
+        self.assertParity(pokesets)
+        self.assertEqual(codec.check_parity(pokesets), [])
+
+    def test_random(self):
+        rng = random.Random(0)
+        self.assertParity([_randomPokeset(rng) for _ in range(500)])
+
+    def test_encode_many(self):
+        rng = random.Random(1)
+        pokesets = [_randomPokeset(rng) for _ in range(6)]
+        self.assertEqual(codec.encode_many(pokesets),
+                         b"".join(map(factory.get_pokemon_bytes, pokesets)))
+
+
+class TestRoundtrip(unittest.TestCase):
+    def test_name(self):
+        for name in ("BULBASAUR", "NIDORAN♀", "MR. MIME", ""):
+            with self.subTest(name=name):
+                self.assertEqual(codec.decode_name(codec.encode_name(name)),
+                                 name)
+
+    def test_name_too_long(self):
+        with self.assertRaises(ValueError):
+            codec.encode_name("ABCDEFGHIJK")
+
+    def test_decode(self):
+        rng = random.Random(2)
+        for data in (_randomPokeset(rng) for _ in range(100)):
+            blob = codec.encode(data)
+            decoded = codec.decode(blob)
+            self.assertEqual(codec.encode(decoded), blob)
+            self.assertEqual(decoded["species"]["id"], data["species"]["id"])
+            self.assertEqual(decoded["level"], data["level"])
+            self.assertEqual(decoded["ingamename"], data["ingamename"])
+            self.assertEqual(decoded["gender"], data["gender"] or None)
+            self.assertEqual([m["id"] for m in decoded["moves"]],
+                             [m["id"] for m in data["moves"]])
+
+
+class TestLazyLibeps(unittest.TestCase):
+    def test_blob_without_libeps(self):
+        # in a fresh interpreter, libeps mustn't have been loaded yet
+        script = ("import sys, json, pbrEngine\n"
+                  "from pbrEngine.eps import get_pokemon_blob\n"
+                  "with open(sys.argv[1], encoding='utf-8') as f:\n"
+                  "    get_pokemon_blob(json.load(f)[0])\n"
+                  "print('pbrEngine.eps.eps' in sys.modules)\n")
+        output = subprocess.check_output(
+            [sys.executable, "-c", script,
+             os.path.join(_ROOT, "testpkmn.json")], cwd=_ROOT)
+        self.assertEqual(output.strip(), b"False")
+
+
+if __name__ == "__main__":
+    unittest.main()
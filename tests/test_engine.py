@@ -0,0 +1,69 @@
+'''
+Created on 18.10.2026
+
+Tests of PBREngine running against a simulated game.
+'''
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import gevent
+
+from pbrEngine import PBREngine
+from pbrEngine.states import PbrStates
+from pbrEngine.simulation import SimulatedDolphin
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _actionCallback(side, fails, moves, switch, cause):
+    return ("a", None) if moves else ("1", None)
+
+
+class TestCorruptedSavestate(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        with open(os.path.join(_ROOT, "testpkmn.json"), encoding="utf-8") as f:
+            self.pkmn = json.load(f)[:6]
+
+    def tearDown(self):
+        self.dolphin.disconnect()
+        shutil.rmtree(self.directory)
+
+    def _engine(self):
+        self.dolphin = SimulatedDolphin(fps=6000, seed=0)
+        pbr = PBREngine(_actionCallback, dolphin=self.dolphin,
+                        savefile_dir=self.directory)
+        pbr.connect()
+        return pbr
+
+    def test_recreates_base_savestate_that_failed_verify(self):
+        # a base savestate whose content doesn't match its stored hash
+        filename = os.path.join(self.directory, "saveWithAnnouncer.state")
+        with open(filename, "w") as f:
+            f.write("corrupted")
+        with open(os.path.join(self.directory, "index.json"), "w") as f:
+            json.dump([{"key": ["base", True], "path": filename,
+                        "pinned": True, "sha1": "0" * 40, "size": 9,
+                        "used": 0}], f)
+        pbr = self._engine()
+        stuck = []
+        pbr.on_stuck += lambda button: stuck.append(button)
+        self.assertEqual(pbr.state, PbrStates.WAITING_FOR_NEW)
+        self.assertTrue(self.dolphin.paused)
+
+        pbr.new(0, self.pkmn[:3], self.pkmn[3:])
+        self.assertEqual(pbr.state, PbrStates.CREATING_SAVE1)
+        self.assertEqual(self.dolphin.calls["load"], 0)
+        self.assertNotIn(("base", True), pbr.savestates)
+        # the game must run, or the stuck checker can't get it going again
+        self.assertFalse(self.dolphin.paused)
+        gevent.sleep(0.5)
+        self.assertGreater(pbr.timer.frame, 0)
+        self.assertTrue(stuck)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+'''
+Created on 18.10.2026
+
+Tests of the pokemon blob cache.
+'''
+
+import os
+import sys
+import json
+import unittest
+import threading
+
+from pbrEngine.eps import factory, codec
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestBlobCache(unittest.TestCase):
+    def setUp(self):
+        with open(os.path.join(_ROOT, "testpkmn.json"), encoding="utf-8") as f:
+            self.pokesets = json.load(f)
+        self.size = factory.blob_cache_info()["maxsize"]
+        factory.invalidate_blob_cache()
+
+    def tearDown(self):
+        factory.set_blob_cache_size(self.size)
+        factory.invalidate_blob_cache()
+
+    def test_hit(self):
+        before = factory.blob_cache_info()
+        blob = factory.get_pokemon_blob(self.pokesets[0])
+        self.assertEqual(blob, codec.encode(self.pokesets[0]))
+        self.assertIs(factory.get_pokemon_blob(self.pokesets[0]), blob)
+        info = factory.blob_cache_info()
+        self.assertEqual(info["misses"] - before["misses"], 1)
+        self.assertEqual(info["hits"] - before["hits"], 1)
+
+    def test_threads(self):
+        # fewer slots than pokesets, so the threads keep evicting
+        factory.set_blob_cache_size(5)
+        before = factory.blob_cache_info()
+        errors = []
+
+        def work():
+            try:
+                for _ in range(50):
+                    for data in self.pokesets:
+                        self.assertEqual(factory.get_pokemon_blob(data),
+                                         codec.encode(data))
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        # switch threads as often as possible to provoke races
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(interval)
+        self.assertEqual(errors, [])
+        info = factory.blob_cache_info()
+        self.assertEqual(info["hits"] + info["misses"]
+                         - before["hits"] - before["misses"],
+                         8 * 50 * len(self.pokesets))
+        self.assertLessEqual(info["size"], 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
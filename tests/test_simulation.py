@@ -0,0 +1,98 @@
+'''
+Created on 18.10.2026
+
+Tests of serving a simulated game over dolphinWatch's protocol.
+'''
+
+import unittest
+import gevent
+from gevent import socket
+
+from pbrEngine.memorymap.addresses import Locations
+from pbrEngine.simulation import SimulatedDolphin, DolphinWatchServer
+
+_FRAMECOUNT = Locations.FRAMECOUNT.value.addr
+# nothing subscribes to it, so its MEM line marks the end of a reply
+_MARKER = Locations.RNG_SEED.value.addr
+
+
+class _RawClient(object):
+    def __init__(self, port):
+        self.sock = socket.create_connection(("localhost", port))
+        self.lines = self.sock.makefile("r", encoding="utf-8")
+
+    def send(self, line):
+        self.sock.sendall((line + "\n").encode("utf-8"))
+
+    def frames(self, until_marker=False):
+        '''
+        Returns the framecounts received before the marker,
+        or the first one if <until_marker> is False.
+        '''
+        frames = []
+        with gevent.Timeout(5):
+            for line in self.lines:
+                cmd, addr, *values = line.split()
+                if cmd == "MEM" and int(addr) == _MARKER:
+                    return frames
+                if cmd == "MEM" and int(addr) == _FRAMECOUNT:
+                    frames.append(int(values[0]))
+                    if not until_marker:
+                        return frames
+
+    def sync(self):
+        '''Returns the framecounts received until all sent commands are done.'''
+        self.send("READ 32 %d" % _MARKER)
+        return self.frames(until_marker=True)
+
+    def close(self):
+        self.lines.close()
+        self.sock.close()
+
+
+class TestDolphinWatchServer(unittest.TestCase):
+    def setUp(self):
+        self.dolphin = SimulatedDolphin(fps=600)
+        self.server = DolphinWatchServer(self.dolphin, port=0)
+        self.server.start()
+        self.port = self.server._server.server_port
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_clients_subscribe_independently(self):
+        engine = _RawClient(self.port)
+        monitor = _RawClient(self.port)
+        for client in (engine, monitor):
+            client.send("SUBSCRIBE 32 %d" % _FRAMECOUNT)
+            self.assertTrue(client.frames())
+
+        # the monitor unsubscribing must not end the engine's updates
+        monitor.send("UNSUBSCRIBE %d" % _FRAMECOUNT)
+        monitor.sync()
+        engine.sync()
+        gevent.sleep(0.2)
+        self.assertEqual(monitor.sync(), [])
+        self.assertTrue(engine.sync())
+
+        # and neither must it disconnecting after subscribing again
+        monitor.send("SUBSCRIBE 32 %d" % _FRAMECOUNT)
+        self.assertTrue(monitor.frames())
+        monitor.close()
+        engine.sync()
+        gevent.sleep(0.2)
+        self.assertTrue(engine.sync())
+        engine.close()
+
+    def test_disconnect_drops_subscriptions(self):
+        client = _RawClient(self.port)
+        client.send("SUBSCRIBE 32 %d" % _FRAMECOUNT)
+        client.send("SUBSCRIBE_MULTI 4 %d" % (_FRAMECOUNT + 4))
+        self.assertTrue(client.frames())
+        client.close()
+        gevent.sleep(0.1)
+        self.assertEqual(self.dolphin._subscriptions, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
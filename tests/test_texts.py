@@ -0,0 +1,120 @@
+'''
+Created on 18.10.2026
+
+Tests of tracking and invalidating the game's texts.
+'''
+
+import unittest
+import gevent
+
+from pbrEngine.abstractions.texts import TextTracker
+from pbrEngine.abstractions.timer import Timer
+from pbrEngine.memorymap.addresses import Loc
+from pbrEngine.memorymap.image import MemoryImage
+from pbrEngine.util import encodeString, isInvalidated
+
+_LOC = Loc(0x1000, 0x20)
+
+
+class TestTextTracker(unittest.TestCase):
+    def setUp(self):
+        self.dolphin = MemoryImage()
+        self.timer = Timer()
+        self.frame = 0
+        self.tracker = TextTracker(self.dolphin, self.timer, _LOC, slots=4,
+                                   delay=10)
+
+    def show(self, slot, text="It's super effective!"):
+        data = encodeString(text) + b"\0\0"
+        self.dolphin.set(_LOC.addr + _LOC.length * slot, data)
+        return self.tracker.seen(data, slot)
+
+    def invalidated(self):
+        return [isInvalidated(self.dolphin.get(_LOC.addr + _LOC.length * i, 4))
+                for i in range(4)]
+
+    def advance(self, frames):
+        self.frame += frames
+        self.timer.updateFramecount(self.frame)
+        gevent.sleep(0)  # let the scheduled jobs run
+
+    def test_ring(self):
+        self.assertTrue(self.show(0))
+        self.assertTrue(self.show(1))
+        # the game advances through the slots, the next one gets invalidated
+        self.assertEqual(self.invalidated(), [False, False, True, False])
+        self.assertTrue(self.show(2))
+        self.assertEqual(self.invalidated(), [False, False, False, True])
+        writes = self.dolphin.writes
+        self.advance(20)
+        # the slot timed before the ring got noticed
+        self.assertEqual(self.invalidated(), [True, False, False, True])
+        self.assertEqual(self.dolphin.writes, writes + 1)
+
+    def test_ignores_invalidations(self):
+        self.show(0)
+        self.advance(20)
+        data = self.dolphin.get(_LOC.addr, _LOC.length)
+        self.assertFalse(self.tracker.seen(data, 0))
+        self.assertFalse(self.tracker.seen(bytes(_LOC.length), 1))
+        # known to be invalidated, no need to write again
+        writes = self.dolphin.writes
+        self.tracker.invalidate(0)
+        self.tracker.invalidate(1)
+        self.assertEqual(self.dolphin.writes, writes)
+
+    def test_timer_per_slot(self):
+        self.show(0)
+        self.advance(5)
+        # not in ring order, must not cancel slot 0's invalidation
+        self.show(2)
+        self.advance(5)
+        self.assertEqual(self.invalidated(), [True, False, False, False])
+        self.advance(5)
+        self.assertEqual(self.invalidated(), [True, False, True, False])
+
+    def test_new_message_restarts_timer(self):
+        self.show(0)
+        self.advance(5)
+        self.show(2)
+        self.show(0, "It's not very effective...")
+        self.advance(5)
+        # the message slot 0 got 5 frames ago is still on screen
+        self.assertEqual(self.invalidated(), [False, False, False, False])
+        self.advance(10)
+        self.assertEqual(self.invalidated(), [True, False, True, False])
+
+    def test_ring_broken(self):
+        self.show(0)
+        self.show(1)
+        self.show(2)
+        self.advance(20)
+        self.assertEqual(self.invalidated(), [True, False, False, True])
+        self.show(1, "A critical hit!")
+        # back to timed invalidation, also of what the ring didn't reach
+        self.assertEqual(self.invalidated(), [True, False, False, True])
+        self.advance(20)
+        self.assertEqual(self.invalidated(), [True, True, True, True])
+        self.show(3)
+        self.advance(5)
+        self.assertEqual(self.invalidated(), [True, True, True, False])
+        self.advance(5)
+        self.assertEqual(self.invalidated(), [True, True, True, True])
+
+    def test_reset(self):
+        self.show(0)
+        self.show(1)
+        self.show(2)
+        self.tracker.reset()
+        self.advance(20)
+        # pending invalidations are dropped
+        self.assertEqual(self.invalidated(), [False, False, False, True])
+        # the ring has to be observed again
+        self.show(0)
+        self.assertEqual(self.invalidated(), [False, False, False, True])
+        self.advance(20)
+        self.assertEqual(self.invalidated(), [True, False, False, True])
+
+
+if __name__ == "__main__":
+    unittest.main()
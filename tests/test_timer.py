@@ -0,0 +1,34 @@
+'''
+Created on 18.10.2026
+
+Tests of the frame based timer.
+'''
+
+import unittest
+
+from pbrEngine.abstractions.timer import Timer
+
+
+class TestSpawnLater(unittest.TestCase):
+    def test_frame_exact(self):
+        timer = Timer()
+        timer.updateFramecount(50)
+        job = timer.spawn_later(100, lambda: None)
+        self.assertEqual(job.frame, 150)
+        self.assertEqual(timer._queue[0][0], job.frame)
+
+    def test_frame_coarse(self):
+        timer = Timer(resolution=0.1)
+        timer.setCoarse(True)
+        self.assertFalse(timer.exact)
+        # a whole sample interval passed since the last framecount,
+        # so it's estimated 6 frames further at full speed
+        timer._timerPrev -= 1
+        job = timer.spawn_later(100, lambda: None)
+        self.assertEqual(job.frame, 106)
+        self.assertEqual(timer._queue[0][0], job.frame)
+        job.cancel()
+
+
+if __name__ == "__main__":
+    unittest.main()